@@ -0,0 +1,124 @@
+"""
+Compare the memory held by the items of a project as the raw response dictionaries
+and as model.ProjectItem, and the time to read their field values.
+
+    python benchmarks/bench_item_memory.py --items 100000
+
+Every representation is measured in its own process, so that the peak RSS of one does
+not hide the other.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from common import setup_environment
+from fake_server import SyntheticProject
+
+setup_environment()
+
+from model import ProjectItem  # noqa: E402
+
+PAGE_SIZE = 100
+
+
+def pages(count):
+    """
+    Yield the items as encoded response pages, as they come from the API
+    """
+    project = SyntheticProject(items=count, comments=0, closed_ratio=0)
+    for start in range(0, count, PAGE_SIZE):
+        nodes = [project.render_item(index) for index in range(start, min(start + PAGE_SIZE, count))]
+        yield json.dumps({'data': {'nodes': nodes}}).encode()
+
+
+def read_dict(item):
+    return (
+        (item.get('dueDate') or {}).get('date'),
+        (item.get('estimate') or {}).get('name'),
+        (item.get('week') or {}).get('id'),
+        (item.get('release') or {}).get('id'),
+        (item.get('size') or {}).get('id'),
+        (item.get('content') or {}).get('url')
+    )
+
+
+def read_model(item):
+    return (item.due_date, item.estimate, item.week_id, item.release_id, item.size_id, item.issue.url)
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def measure(mode, count):
+    # Encode the pages first, so that the baseline includes them
+    encoded = list(pages(count))
+    baseline = peak_rss()
+
+    start = time.perf_counter()
+    items = []
+    for page in encoded:
+        nodes = json.loads(page)['data']['nodes']
+        if mode == 'model':
+            items.extend(ProjectItem.from_node(node) for node in nodes)
+        else:
+            items.extend(nodes)
+        del nodes
+    decode_time = time.perf_counter() - start
+
+    read = read_model if mode == 'model' else read_dict
+    start = time.perf_counter()
+    for _ in range(5):
+        for item in items:
+            read(item)
+    read_time = (time.perf_counter() - start) / 5
+
+    return {
+        'mode': mode,
+        'items': len(items),
+        'held_rss': peak_rss() - baseline,
+        'decode_time': decode_time,
+        'read_time': read_time
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--mode', choices=('dict', 'model'), help='Measure one representation in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.items)))
+        return
+
+    print(f'{args.items} items')
+    results = {}
+    for mode in ('dict', 'model'):
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--items', str(args.items), '--mode', mode],
+            text=True
+        )
+        result = json.loads(output)
+        results[mode] = result
+        print(
+            f"{mode:<6} held RSS {result['held_rss'] / 1024 / 1024:8.1f} MiB | "
+            f"{result['held_rss'] / result['items']:7.0f} bytes/item | "
+            f"decode {result['decode_time'] * 1000:8.1f} ms | "
+            f"read {result['read_time'] / result['items'] * 1e9:6.0f} ns/item"
+        )
+
+    before, after = results['dict'], results['model']
+    print(
+        f"Held memory: {(after['held_rss'] - before['held_rss']) / before['held_rss'] * 100:+.1f}% | "
+        f"Field reads: {(after['read_time'] - before['read_time']) / before['read_time'] * 100:+.1f}%"
+    )
+
+
+if __name__ == '__main__':
+    main()
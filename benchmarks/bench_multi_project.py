@@ -0,0 +1,76 @@
+"""
+Compare processing several projects with one run per project against a single run
+given all of them through the projects input.
+
+    python benchmarks/bench_multi_project.py --projects 5 --items 2000 --latency-ms 20
+
+The fake server serves the same synthetic project for every project number, so the
+runs are dry runs by default: every project then needs exactly the same reads, and
+the difference is the startup, the connections and the concurrency of the projects.
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+from fake_server import SyntheticProject, start_server
+from run_benchmark import run_action
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--projects', type=int, default=5)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--project-concurrency', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--async-mode', action='store_true')
+    parser.add_argument('--writes', action='store_true', help='Send the writes instead of running dry')
+    parser.add_argument('--env', action='append', default=[], help='Extra KEY=VALUE passed to the action')
+    parser.add_argument('--show-output', action='store_true')
+    args = parser.parse_args()
+
+    # Same pacing as run_benchmark.py, to measure the action itself
+    args.dry_run = not args.writes
+    args.write_interval = 0
+    args.secondary_points_per_minute = 1000000
+
+    project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=0.5, seed=args.seed)
+    server = start_server(project, latency=args.latency_ms / 1000, seed=args.seed)
+    numbers = [str(number) for number in range(1, args.projects + 1)]
+
+    # One run per project, as separate workflow steps would do
+    start = time.perf_counter()
+    before = server.stats['requests']
+    for number in numbers:
+        with tempfile.TemporaryDirectory() as workspace:
+            exit_code, _, _, output = run_action(server, args, workspace, extra_env={'INPUT_PROJECT_NUMBER': number})
+        if exit_code:
+            print(output)
+            return exit_code
+    separate_time = time.perf_counter() - start
+    separate_requests = server.stats['requests'] - before
+
+    # All the projects in one run
+    before = server.stats['requests']
+    with tempfile.TemporaryDirectory() as workspace:
+        exit_code, single_time, _, output = run_action(server, args, workspace, extra_env={
+            'INPUT_PROJECT_NUMBER': '',
+            'INPUT_PROJECTS': ','.join(numbers),
+            'INPUT_PROJECT_CONCURRENCY': str(args.project_concurrency)
+        })
+    single_requests = server.stats['requests'] - before
+    if args.show_output or exit_code:
+        print(output)
+    server.shutdown()
+
+    print(f'{args.projects} projects of {args.items} items')
+    print(f'One run per project: {separate_time:6.2f}s | {separate_requests:5} requests')
+    print(f'One run:             {single_time:6.2f}s | {single_requests:5} requests')
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Compare the Release lookups of utils.ReleaseCalendar against find_release.
+
+    python benchmarks/bench_release_lookup.py --releases 40 --items 5000
+"""
+import argparse
+import logging
+import random
+import time
+from datetime import date, timedelta
+
+from common import setup_environment
+
+setup_environment()
+
+import utils  # noqa: E402
+
+
+def make_releases(count):
+    """
+    Two-week releases around today, named like 'Dec 23 - Jan 05 (v12)', with a few
+    names carrying explicit years and a few that cannot be parsed
+    """
+    first = date.today() - timedelta(weeks=count)
+    releases = []
+    for index in range(count):
+        start = first + timedelta(weeks=2 * index)
+        end = start + timedelta(days=13)
+        if index % 7 == 0:
+            name = f'{start.strftime("%b %d, %Y")} - {end.strftime("%b %d, %Y")} (v{index})'
+        elif index % 11 == 0:
+            name = f'Sprint {index} - unscheduled (v{index})'
+        else:
+            name = f'{start.strftime("%b %d")} - {end.strftime("%b %d")} (v{index})'
+        releases.append({'id': f'release-{index}', 'name': name})
+
+    random.shuffle(releases)
+    return releases
+
+
+def measure(label, lookup, dates):
+    start = time.perf_counter()
+    results = [lookup(date_str) for date_str in dates]
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {elapsed * 1000:10.1f} ms  {elapsed / len(dates) * 1e6:8.1f} us/item')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--releases', type=int, default=40)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    releases = make_releases(args.releases)
+    first = date.today() - timedelta(weeks=args.releases + 4)
+    dates = [(first + timedelta(days=random.randrange(28 * args.releases))).isoformat() for _ in range(args.items)]
+
+    # find_release logs every unparseable name for every item
+    logging.disable(logging.ERROR)
+
+    print(f'{args.items} items, {args.releases} releases')
+    expected = measure('find_release', lambda date_str: utils.find_release(releases, date_str), dates)
+
+    start = time.perf_counter()
+    calendar = utils.ReleaseCalendar(releases)
+    print(f'{"ReleaseCalendar build":<28} {(time.perf_counter() - start) * 1000:10.1f} ms')
+    actual = measure('ReleaseCalendar.find_release', calendar.find_release, dates)
+
+    mismatches = sum(1 for left, right in zip(expected, actual) if left != right)
+    print(f'Mismatches: {mismatches}')
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
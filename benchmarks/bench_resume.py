@@ -0,0 +1,83 @@
+"""
+Interrupt a sweep partway through with an outage of the fake GraphQL server, run it again
+with the same cache, and compare the requests of both runs with one uninterrupted run.
+
+    python benchmarks/bench_resume.py --items 3000 --fail-after 200
+    python benchmarks/bench_resume.py --items 3000 --fail-after 200 --no-journal
+
+With the journal, the second run resumes after the last page the first one completed,
+so both runs together send about as many requests as the uninterrupted one, and no
+comment twice.
+"""
+import argparse
+import sys
+import tempfile
+
+from fake_server import SyntheticProject, start_server
+from run_benchmark import run_action
+
+
+def operations_delta(before, after):
+    return {name: count - before.get(name, 0) for name, count in after.items() if count - before.get(name, 0)}
+
+
+def run(server, args, workspace, label):
+    before = dict(server.stats['operations'])
+    exit_code, wall_time, _, output = run_action(server, args, workspace, extra_env={
+        'INPUT_CACHE_DIR': '.project-automations-cache',
+        'INPUT_JOURNAL': str(not args.no_journal),
+        # The outage outlasts any retry, so it may as well end the run early
+        'INPUT_RETRY_DEADLINE': '5'
+    })
+    operations = operations_delta(before, server.stats['operations'])
+    print(f'{label:<14} exit code {exit_code} | {wall_time:6.2f}s | {sum(operations.values()):5} requests | {operations}')
+    if args.show_output:
+        print(output)
+
+    return operations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=3000)
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--fail-after', type=int, default=200, help='Requests after which the first run fails')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--async-mode', action='store_true')
+    parser.add_argument('--no-journal', action='store_true')
+    parser.add_argument('--env', action='append', default=[], help='Extra KEY=VALUE passed to the action')
+    parser.add_argument('--show-output', action='store_true')
+    args = parser.parse_args()
+
+    # Same pacing as run_benchmark.py, to measure the action itself
+    args.dry_run = False
+    args.write_interval = 0
+    args.secondary_points_per_minute = 1000000
+
+    def new_server(**kwargs):
+        project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=0.5, seed=args.seed)
+        return start_server(project, seed=args.seed, **kwargs)
+
+    server = new_server()
+    with tempfile.TemporaryDirectory() as workspace:
+        uninterrupted = run(server, args, workspace, 'uninterrupted')
+    server.shutdown()
+
+    server = new_server(fail_after=args.fail_after)
+    with tempfile.TemporaryDirectory() as workspace:
+        interrupted = run(server, args, workspace, 'interrupted')
+        server.fail_after = None
+        resumed = run(server, args, workspace, 'rerun')
+    server.shutdown()
+
+    total = {name: interrupted.get(name, 0) + resumed.get(name, 0) for name in set(interrupted) | set(resumed)}
+    print(
+        f"Both runs: {sum(total.values())} requests, {total.get('AddIssueComment', 0)} comments | "
+        f"Uninterrupted: {sum(uninterrupted.values())} requests, {uninterrupted.get('AddIssueComment', 0)} comments"
+    )
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
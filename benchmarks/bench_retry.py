@@ -0,0 +1,84 @@
+"""
+Run the action against a fake server that fails some of the requests, and compare its
+writes with the ones of a run against a server that never fails.
+
+    python benchmarks/bench_retry.py --items 300 --error-rate 0.05 --lost-response-rate 0.05
+
+The error rate answers requests with a 502 before they are applied. The lost response
+rate applies mutations but answers them with a 504, so a comment retried blindly would
+be posted twice.
+"""
+import argparse
+import collections
+import sys
+import tempfile
+
+from fake_server import SyntheticProject, start_server
+from run_benchmark import run_action
+
+
+def run(args, error_rate, lost_response_rate):
+    project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=0.5, seed=args.seed)
+    server = start_server(
+        project,
+        latency=args.latency_ms / 1000,
+        seed=args.seed,
+        error_rate=error_rate,
+        lost_response_rate=lost_response_rate
+    )
+    with tempfile.TemporaryDirectory() as workspace:
+        exit_code, wall_time, _, output = run_action(server, args, workspace)
+    server.shutdown()
+
+    bodies = collections.Counter(
+        (issue_id, comment['body'])
+        for issue_id, comments in project.added_comments.items()
+        for comment in comments
+    )
+    return {
+        'exit_code': exit_code,
+        'wall_time': wall_time,
+        'requests': server.stats['requests'],
+        'injected': server.stats['errors_injected'],
+        'comments': len(bodies),
+        'duplicates': sum(count - 1 for count in bodies.values()),
+        'fields': [item[2:] for item in project.items],
+        'output': output
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=300)
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--lost-response-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--async-mode', action='store_true')
+    parser.add_argument('--env', action='append', default=[], help='Extra KEY=VALUE passed to the action')
+    parser.add_argument('--show-output', action='store_true')
+    args = parser.parse_args()
+
+    args.dry_run = False
+    args.write_interval = 0
+    args.secondary_points_per_minute = 1000000
+
+    clean = run(args, 0, 0)
+    failing = run(args, args.error_rate, args.lost_response_rate)
+    if args.show_output or failing['exit_code']:
+        print(failing['output'])
+
+    print(f'{args.items} items, {args.error_rate:.0%} failed requests, {args.lost_response_rate:.0%} lost mutation responses')
+    for name, result in (('No failures', clean), ('Failures', failing)):
+        print(
+            f"{name:12}: exit {result['exit_code']} | {result['wall_time']:6.2f}s | {result['requests']:5} requests | "
+            f"{result['injected']:3} injected | {result['comments']:4} comments | {result['duplicates']:3} duplicates"
+        )
+    print(f"Same field values: {clean['fields'] == failing['fields']}")
+
+    return failing['exit_code']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Compare a run with a single token against a run spreading its requests over a pool of
+tokens, when every token has a small rate limit budget.
+
+    python benchmarks/bench_token_pool.py --tokens 3 --items 1000 --token-budget 150 --budget-window 5
+
+The fake server gives every token its own budget, reset every budget window, so a run
+that spends more than the budget of one token waits for the resets.
+"""
+import argparse
+import sys
+import tempfile
+
+from fake_server import SyntheticProject, start_server
+from run_benchmark import run_action
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, default=3)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--token-budget', type=int, default=150)
+    parser.add_argument('--budget-window', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--async-mode', action='store_true')
+    parser.add_argument('--env', action='append', default=[], help='Extra KEY=VALUE passed to the action')
+    parser.add_argument('--show-output', action='store_true')
+    args = parser.parse_args()
+
+    # Only the primary budget paces the runs
+    args.dry_run = False
+    args.write_interval = 0
+    args.secondary_points_per_minute = 1000000
+
+    results = []
+    for tokens in (1, args.tokens):
+        project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=0.5, seed=args.seed)
+        server = start_server(
+            project,
+            latency=args.latency_ms / 1000,
+            seed=args.seed,
+            token_budget=args.token_budget,
+            budget_window=args.budget_window
+        )
+        with tempfile.TemporaryDirectory() as workspace:
+            exit_code, wall_time, _, output = run_action(server, args, workspace, extra_env={
+                'INPUT_RATE_LIMIT_RESERVE': '0',
+                'INPUT_GH_TOKENS': ','.join(f'benchmark-token-{index}' for index in range(1, tokens))
+            })
+        server.shutdown()
+        if args.show_output or exit_code:
+            print(output)
+        if exit_code:
+            return exit_code
+        results.append((tokens, wall_time, server.stats['requests'], output.count('Rate limited')))
+
+    print(f'{args.items} items, {args.token_budget} points per token every {args.budget_window}s')
+    for tokens, wall_time, requests, limited in results:
+        print(f'{tokens} token(s): {wall_time:6.2f}s | {requests:5} requests | {limited:3} rate limited')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Compare the Week lookups of utils.IterationIndex against find_week and find_previous_week.
+
+    python benchmarks/bench_week_lookup.py --weeks 260 --items 5000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from common import setup_environment
+
+setup_environment()
+
+import utils  # noqa: E402
+
+
+def make_weeks(count):
+    today = date.today()
+    first = today - timedelta(days=today.weekday()) - timedelta(weeks=count - 8)
+    weeks = [
+        {
+            'id': f'week-{index}',
+            'title': f'Week {index}',
+            'startDate': (first + timedelta(weeks=index)).isoformat(),
+            'duration': 7
+        }
+        for index in range(count)
+    ]
+    # The API returns the upcoming iterations before the completed ones
+    random.shuffle(weeks)
+    return weeks
+
+
+def make_dates(weeks, count):
+    starts = sorted(date.fromisoformat(week['startDate']) for week in weeks)
+    first = starts[0] - timedelta(days=14)
+    span = (starts[-1] - first).days + 28
+    return [(first + timedelta(days=random.randrange(span))).isoformat() for _ in range(count)]
+
+
+def measure(label, lookup, dates):
+    start = time.perf_counter()
+    results = [lookup(date_str) for date_str in dates]
+    elapsed = time.perf_counter() - start
+    print(f'{label:<24} {elapsed * 1000:10.1f} ms  {elapsed / len(dates) * 1e6:8.1f} us/item')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weeks', type=int, default=260)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    weeks = make_weeks(args.weeks)
+    dates = make_dates(weeks, args.items)
+
+    print(f'{args.items} items, {args.weeks} iterations')
+    expected = measure('find_week', lambda date_str: utils.find_week(weeks, date_str), dates)
+
+    start = time.perf_counter()
+    index = utils.IterationIndex(weeks)
+    print(f'{"IterationIndex build":<24} {(time.perf_counter() - start) * 1000:10.1f} ms')
+    actual = measure('IterationIndex.find_week', index.find_week, dates)
+
+    mismatches = sum(1 for left, right in zip(expected, actual) if left != right)
+    print(f'Mismatches: {mismatches}')
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def setup_environment(**overrides):
+    """
+    Provide the action inputs that config.py requires and make the src modules importable
+    """
+    defaults = {
+        'GITHUB_REPOSITORY_OWNER': 'benchmark',
+        'INPUT_REPOSITORY_OWNER_TYPE': 'organization',
+        'GITHUB_SERVER_URL': 'http://127.0.0.1',
+        'INPUT_GH_TOKEN': 'benchmark-token',
+        'INPUT_PROJECT_NUMBER': '1',
+        'GITHUB_GRAPHQL_URL': 'http://127.0.0.1:1/graphql',
+        'INPUT_DUEDATE_FIELD_NAME': 'Due Date',
+        'INPUT_COMMENTS_ISSUE_NUMBER': 'False',
+        'INPUT_COMMENTS_ISSUE_REPO': 'False',
+    }
+    defaults.update(overrides)
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
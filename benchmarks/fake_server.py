@@ -0,0 +1,518 @@
+"""
+A local stand-in for the GitHub GraphQL API, implementing the queries and the
+mutations of src/graphql.py against a synthetic project.
+
+    python benchmarks/fake_server.py --items 10000 --comments 40 --latency-ms 20
+
+The operations are dispatched on their name, and every dynamic part of them is
+read from the variables, so no GraphQL parsing is needed.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VIEWER_LOGIN = 'benchmark-bot'
+COMMENTS_ISSUE_ID = 'I_COMMENTS'
+DUEDATE_COMMENT_PREFIX = 'The Due Date is updated to:'
+
+ESTIMATES = ['30 min', '3 hours', '1 day', '2 days', '3 days', '1 week', '2 weeks']
+SIZES = [
+    'Tiny (< 1 day, 1-6 hours)',
+    'Small (1-2 days)',
+    'Medium (2+ -4 days)',
+    'Large (4+ -7 days)',
+    'X-Large (1-4 weeks)'
+]
+
+OPERATION = re.compile(r'^\s*(?:query|mutation)\s+(\w+)')
+OWNER_TYPE = re.compile(r'\b(organization|user)\(login:')
+
+
+class SyntheticProject:
+    """
+    A project with weekly iterations, two-week releases, and items whose fields
+    and comment threads are derived from a seed, so they are only built on demand.
+    """
+
+    def __init__(self, items=1000, comments=10, closed_ratio=0.5, weeks=104, seed=1):
+        self.item_count = items
+        self.comment_count = comments
+        self.seed = seed
+
+        today = date.today()
+        monday = today - timedelta(days=today.weekday())
+        first_week = monday - timedelta(weeks=weeks - 12)
+
+        self.weeks = [
+            {
+                'id': f'ITER_{index}',
+                'title': f'Week {index + 1}',
+                'startDate': (first_week + timedelta(weeks=index)).isoformat(),
+                'duration': 7
+            }
+            for index in range(weeks)
+        ]
+        self.releases = []
+        for index in range(weeks // 2):
+            start = first_week + timedelta(weeks=2 * index)
+            end = start + timedelta(days=13)
+            self.releases.append({
+                'id': f'REL_{index}',
+                'name': f'{start.strftime("%b %d")} - {end.strftime("%b %d")} (v{index})'
+            })
+        self.sizes = [{'id': f'SIZE_{index}', 'name': name} for index, name in enumerate(SIZES)]
+        self.estimates = [{'id': f'EST_{index}', 'name': name} for index, name in enumerate(ESTIMATES)]
+
+        self.first_date = first_week
+        self.span_days = weeks * 7
+
+        # Items are kept as compact lists: [open, due date, estimate, week, release, size]
+        self.items = [self._make_item(index, closed_ratio) for index in range(items)]
+        self.open_items = [index for index, item in enumerate(self.items) if item[0]]
+
+        self.added_comments = {}
+        self.comment_ids = 0
+        self.lock = threading.Lock()
+
+    def _make_item(self, index, closed_ratio):
+        rng = random.Random(self.seed * 1000003 + index)
+        is_open = rng.random() >= closed_ratio
+        due_date = None
+        if rng.random() < 0.8:
+            due_date = (self.first_date + timedelta(days=rng.randrange(self.span_days))).isoformat()
+        estimate = rng.randrange(len(ESTIMATES)) if rng.random() < 0.7 else None
+        week = rng.randrange(len(self.weeks)) if rng.random() < 0.3 else None
+        release = rng.randrange(len(self.releases)) if rng.random() < 0.3 else None
+        size = rng.randrange(len(SIZES)) if rng.random() < 0.3 else None
+        return [is_open, due_date, estimate, week, release, size]
+
+    # Rendering
+
+    def render_schema(self):
+        return {
+            'id': 'PVT_benchmark',
+            'fields': {
+                'nodes': [
+                    {'id': 'FIELD_DUE', 'name': 'Due Date', 'updatedAt': '2024-01-01T00:00:00Z'},
+                    {
+                        'id': 'FIELD_WEEK', 'name': 'Week', 'updatedAt': '2024-01-01T00:00:00Z',
+                        'configuration': {
+                            'iterations': self.weeks[-12:],
+                            'completedIterations': self.weeks[:-12]
+                        }
+                    },
+                    {'id': 'FIELD_RELEASE', 'name': 'Release', 'updatedAt': '2024-01-01T00:00:00Z', 'options': self.releases},
+                    {'id': 'FIELD_SIZE', 'name': 'Size', 'updatedAt': '2024-01-01T00:00:00Z', 'options': self.sizes},
+                    {'id': 'FIELD_ESTIMATE', 'name': 'Estimate', 'updatedAt': '2024-01-01T00:00:00Z', 'options': self.estimates},
+                ]
+            }
+        }
+
+    def render_item(self, index):
+        is_open, due_date, estimate, week, release, size = self.items[index]
+        return {
+            'id': f'PVTI_{index}',
+            'dueDate': {'id': f'DUE_{index}', 'date': due_date} if due_date else None,
+            'release': dict(self.releases[release]) if release is not None else None,
+            'week': dict(self.weeks[week]) if week is not None else None,
+            'estimate': dict(self.estimates[estimate]) if estimate is not None else None,
+            'size': dict(self.sizes[size]) if size is not None else None,
+            'content': {
+                'id': f'I_{index}',
+                'title': f'Synthetic issue {index}',
+                'number': index + 1,
+                'state': 'OPEN' if is_open else 'CLOSED',
+                'url': f'https://github.com/benchmark/repo/issues/{index + 1}',
+                'assignees': {'nodes': [{'name': 'Dev', 'email': '', 'login': f'dev{index % 7}'}]}
+            }
+        }
+
+    def comments(self, issue_id):
+        """
+        The comment thread of an issue, with a due date notice of the bot in the middle of it.
+        The comments issue only holds the comments added to it.
+        """
+        added = self.added_comments.get(issue_id, [])
+        if issue_id == COMMENTS_ISSUE_ID:
+            return list(added)
+
+        issue_index = int(issue_id.split('_')[1])
+        rng = random.Random(self.seed * 7919 + issue_index)
+        count = rng.randint(0, self.comment_count * 2)
+        due_date = self.items[issue_index][1]
+
+        thread = []
+        notice_at = rng.randrange(count) if count and due_date and rng.random() < 0.5 else None
+        for position in range(count):
+            if position == notice_at:
+                announced = date.fromisoformat(due_date).strftime('%b %d, %Y')
+                thread.append({
+                    'id': f'IC_{issue_index}_{position}',
+                    'body': f'@dev {DUEDATE_COMMENT_PREFIX} {announced}.',
+                    'author': {'login': VIEWER_LOGIN}
+                })
+            else:
+                thread.append({
+                    'id': f'IC_{issue_index}_{position}',
+                    'body': f'Discussion comment {position} ' + 'lorem ipsum ' * 20,
+                    'author': {'login': f'dev{position % 7}'}
+                })
+
+        return thread + added
+
+    # Mutations
+
+    def add_comment(self, issue_id, body):
+        # Comments are kept by issue ID, as they can also go to the comments issue
+        with self.lock:
+            self.comment_ids += 1
+            self.added_comments.setdefault(issue_id, []).append({
+                'id': f'IC_added_{self.comment_ids}',
+                'body': body,
+                'author': {'login': VIEWER_LOGIN}
+            })
+
+    def update_comment(self, comment_id, body):
+        with self.lock:
+            for thread in self.added_comments.values():
+                for comment in thread:
+                    if comment['id'] == comment_id:
+                        comment['body'] = body
+                        return True
+        return False
+
+    def update_field(self, item_id, field_id, value):
+        index = int(item_id.split('_')[1])
+        slot = {'FIELD_WEEK': 3, 'FIELD_RELEASE': 4, 'FIELD_SIZE': 5}.get(field_id)
+        if slot is None:
+            return False
+
+        option_id = value.get('iterationId') or value.get('singleSelectOptionId')
+        with self.lock:
+            self.items[index][slot] = int(option_id.split('_')[1])
+        return True
+
+
+class FakeGraphQLServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, project, port=0, latency=0.0, error_rate=0.0, items_query=True, seed=1, fail_after=None,
+                 token_budget=None, budget_window=3600, lost_response_rate=0.0, owner_type='organization'):
+        super().__init__(('127.0.0.1', port), FakeGraphQLHandler)
+        self.project = project
+        self.latency = latency
+        self.error_rate = error_rate
+        # Mutations applied whose response is lost to a server error, as when a gateway times out
+        self.lost_response_rate = lost_response_rate
+        # Answer every request after this many with no data, like an outage that kills the run
+        self.fail_after = fail_after
+        self.items_query = items_query
+        # The owner of the project is only found under its own type, as with GitHub
+        self.owner_type = owner_type
+        self.random = random.Random(seed)
+
+        # Primary rate limit of every token, reset every budget_window seconds
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.budgets = {}
+
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'bytes_received': 0, 'bytes_sent': 0, 'errors_injected': 0, 'operations': {}}
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/graphql'
+
+    def spend(self, authorization):
+        """
+        Spend a point of the budget of a token and return its (limit, remaining, reset_at),
+        remaining is negative once the budget ran out
+        """
+        limit = self.token_budget or 5000
+        with self.stats_lock:
+            if not self.token_budget:
+                return limit, limit, int(time.time()) + self.budget_window
+            remaining, reset_at = self.budgets.get(authorization, (limit, 0))
+            if reset_at <= time.time():
+                remaining, reset_at = limit, int(time.time()) + self.budget_window
+            remaining -= 1
+            self.budgets[authorization] = (max(remaining, 0), reset_at)
+
+        return limit, remaining, reset_at
+
+    def record(self, operation, received, sent, injected=False):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_received'] += received
+            self.stats['bytes_sent'] += sent
+            self.stats['errors_injected'] += int(injected)
+            self.stats['operations'][operation] = self.stats['operations'].get(operation, 0) + 1
+
+
+class FakeGraphQLHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which would otherwise stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        request = json.loads(raw)
+        query = request.get('query', '')
+        variables = request.get('variables') or {}
+
+        match = OPERATION.match(query)
+        operation = match.group(1) if match else 'Anonymous'
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.error_rate and self.server.random.random() < self.server.error_rate:
+            body = b'<html><body>502 Bad Gateway</body></html>'
+            self._send(502, body, 'text/html')
+            self.server.record(operation, len(raw), len(body), injected=True)
+            return
+
+        handler = getattr(self, f'op_{operation}', None)
+        rate = self.server.spend(self.headers.get('Authorization'))
+        if rate[1] < 0:
+            payload = {'data': None, 'errors': [{'type': 'RATE_LIMITED', 'message': 'API rate limit exceeded'}]}
+        elif self.server.fail_after is not None and self.server.stats['requests'] >= self.server.fail_after:
+            payload = {'data': None, 'errors': [{'message': 'Something went wrong while executing your query.'}]}
+        elif handler is None:
+            payload = {'errors': [{'message': f'Unknown operation {operation}'}]}
+        else:
+            payload = handler(query, variables)
+            if 'rateLimit' in query and payload.get('data') is not None:
+                payload['data']['rateLimit'] = {'cost': 1, 'remaining': 5000, 'resetAt': '2100-01-01T00:00:00Z'}
+
+        if self.server.lost_response_rate and query.lstrip().startswith('mutation') \
+                and self.server.random.random() < self.server.lost_response_rate:
+            body = b'<html><body>504 Gateway Timeout</body></html>'
+            self._send(504, body, 'text/html')
+            self.server.record(operation, len(raw), len(body), injected=True)
+            return
+
+        body = json.dumps(payload).encode()
+        self._send(200, body, 'application/json', rate)
+        self.server.record(operation, len(raw), len(body))
+
+    def _send(self, status, body, content_type, rate=None):
+        limit, remaining, reset_at = rate or (5000, 5000, int(time.time()) + 3600)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Limit', str(limit))
+        self.send_header('X-RateLimit-Remaining', str(max(remaining, 0)))
+        self.send_header('X-RateLimit-Reset', str(reset_at))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Queries
+
+    def op_GetViewer(self, query, variables):
+        return {'data': {'viewer': {'login': VIEWER_LOGIN}}}
+
+    def _owner(self, query, project):
+        """
+        Answer a query on the project owner, which is not found under the other owner type
+        """
+        owner_type = OWNER_TYPE.search(query).group(1)
+        if owner_type != self.server.owner_type:
+            return {'data': {owner_type: None}, 'errors': [
+                {'type': 'NOT_FOUND', 'path': [owner_type], 'message': f'Could not resolve to an {owner_type.capitalize()}'}
+            ]}
+
+        return {'data': {owner_type: {'projectV2': project}}}
+
+    def op_GetProject(self, query, variables):
+        return self._owner(query, self.server.project.render_schema())
+
+    def op_GetProjectFieldsVersion(self, query, variables):
+        schema = self.server.project.render_schema()
+        nodes = [{'id': field['id'], 'updatedAt': field['updatedAt']} for field in schema['fields']['nodes']]
+        return self._owner(query, {'fields': {'nodes': nodes}})
+
+    def op_GetIssue(self, query, variables):
+        return {'data': {'repository': {'issue': {
+            'id': COMMENTS_ISSUE_ID, 'number': variables.get('issueNumber'), 'title': 'Comments', 'body': '',
+            'state': 'OPEN', 'author': {'login': VIEWER_LOGIN}, 'createdAt': '2024-01-01T00:00:00Z',
+            'updatedAt': '2024-01-01T00:00:00Z', 'labels': {'nodes': []}
+        }}}}
+
+    def _items_page(self, query, variables, indexes, render):
+        start = int(variables.get('after') or 0)
+        page = indexes[start:start + 100]
+        return self._owner(query, {
+            'id': 'PVT_benchmark',
+            'title': 'Benchmark',
+            'number': variables.get('projectNumber'),
+            'items': {
+                'nodes': [render(index) for index in page],
+                'pageInfo': {
+                    'endCursor': str(start + len(page)),
+                    'hasNextPage': start + len(page) < len(indexes),
+                    'hasPreviousPage': start > 0
+                },
+                'totalCount': len(indexes)
+            }
+        })
+
+    def op_GetProjectIssues(self, query, variables):
+        project = self.server.project
+        if 'query' in variables:
+            if not self.server.items_query:
+                return {'errors': [{'message': "Field 'items' doesn't accept argument 'query'"}]}
+            indexes = project.open_items
+        else:
+            indexes = range(project.item_count)
+
+        return self._items_page(query, variables, indexes, project.render_item)
+
+    def op_GetProjectItemStates(self, query, variables):
+        project = self.server.project
+
+        def render(index):
+            return {'id': f'PVTI_{index}', 'content': {'state': 'OPEN' if project.items[index][0] else 'CLOSED'}}
+
+        return self._items_page(query, variables, range(project.item_count), render)
+
+    def op_GetProjectItems(self, query, variables):
+        project = self.server.project
+        return {'data': {'nodes': [project.render_item(int(item_id.split('_')[1])) for item_id in variables['ids']]}}
+
+    def op_GetProjectItem(self, query, variables):
+        index = self._node_index(variables['id'], 'PVTI_')
+        return {'data': {'node': self.server.project.render_item(index) if index is not None else None}}
+
+    def op_GetIssueProjectItems(self, query, variables):
+        index = self._node_index(variables['id'], 'I_')
+        if index is None:
+            return {'data': {'node': None}}
+
+        # The issue is also in another project, whose item must be skipped
+        project = self.server.project
+        other = dict(project.render_item(index), id=f'PVTI_other_{index}', project={'id': 'PVT_other'})
+        item = dict(project.render_item(index), project={'id': 'PVT_benchmark'})
+        return {'data': {'node': {'projectItems': {'nodes': [other, item]}}}}
+
+    def _node_index(self, node_id, prefix):
+        if not node_id.startswith(prefix) or not node_id[len(prefix):].isdigit():
+            return None
+        index = int(node_id[len(prefix):])
+        return index if index < self.server.project.item_count else None
+
+    def op_GetIssueComments(self, query, variables):
+        thread = self.server.project.comments(variables['issueId'])
+        start = int(variables.get('afterCursor') or 0)
+        page = thread[start:start + 100]
+        return {'data': {'node': {'comments': {
+            'nodes': page,
+            'pageInfo': {'endCursor': str(start + len(page)), 'hasNextPage': start + len(page) < len(thread)}
+        }}}}
+
+    def op_GetRecentIssueComments(self, query, variables):
+        last = variables['last']
+        data = {}
+        for key, issue_id in variables.items():
+            if not key.startswith('id'):
+                continue
+            index = key[2:]
+            thread = self.server.project.comments(issue_id)
+            before = variables.get(f'before{index}')
+            end = int(before) if before is not None else len(thread)
+            start = max(end - last, 0)
+            data[f'i{index}'] = {'comments': {
+                'nodes': thread[start:end],
+                'pageInfo': {'startCursor': str(start), 'hasPreviousPage': start > 0}
+            }}
+        return {'data': data}
+
+    # Mutations
+
+    def op_AddIssueComment(self, query, variables):
+        self.server.project.add_comment(variables['issueId'], variables['comment'])
+        return {'data': {'addComment': {'clientMutationId': None}}}
+
+    def op_UpdateIssueComment(self, query, variables):
+        if not self.server.project.update_comment(variables['commentId'], variables['comment']):
+            return {'data': None, 'errors': [{'type': 'NOT_FOUND', 'message': 'Could not resolve to a node'}]}
+        return {'data': {'updateIssueComment': {'issueComment': {'id': variables['commentId']}}}}
+
+    def op_UpdateProjectV2ItemFieldValue(self, query, variables):
+        value = variables['input']
+        self.server.project.update_field(value['itemId'], value['fieldId'], value['value'])
+        return {'data': {'updateProjectV2ItemFieldValue': {'projectV2Item': {'id': value['itemId']}}}}
+
+    def op_BulkUpdateProjectV2ItemFieldValues(self, query, variables):
+        data = {}
+        errors = []
+        for alias, value in variables.items():
+            if self.server.project.update_field(value['itemId'], value['fieldId'], value['value']):
+                data[alias] = {'projectV2Item': {'id': value['itemId']}}
+            else:
+                data[alias] = None
+                errors.append({'path': [alias], 'message': f"Field {value['fieldId']} cannot be updated"})
+
+        payload = {'data': data}
+        if errors:
+            payload['errors'] = errors
+        return payload
+
+
+def start_server(project, **kwargs):
+    """
+    Start a fake server in a background thread and return it
+    """
+    server = FakeGraphQLServer(project, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--closed-ratio', type=float, default=0.5)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--lost-response-rate', type=float, default=0, help='Share of the mutations applied but answered with a 504')
+    parser.add_argument('--fail-after', type=int, help='Answer the requests after this many with no data')
+    parser.add_argument('--token-budget', type=int, help='Rate limit points of every token per budget window')
+    parser.add_argument('--budget-window', type=int, default=3600, help='Seconds between the resets of the token budgets')
+    parser.add_argument('--no-items-query', action='store_true', help='Reject the items search query argument')
+    parser.add_argument('--owner-type', choices=('organization', 'user'), default='organization')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=args.closed_ratio, seed=args.seed)
+    server = FakeGraphQLServer(
+        project,
+        port=args.port,
+        latency=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        items_query=not args.no_items_query,
+        seed=args.seed,
+        fail_after=args.fail_after,
+        lost_response_rate=args.lost_response_rate,
+        owner_type=args.owner_type,
+        token_budget=args.token_budget,
+        budget_window=args.budget_window
+    )
+    print(f'Serving {args.items} items on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Replay the recorded event payloads of fixtures/events against the fake GraphQL server,
+running main.py in event mode, and report the requests and the wall time of every event.
+
+    python benchmarks/replay_events.py --check
+    python benchmarks/replay_events.py fixtures/events/issues.edited.json --show-output
+
+The fixtures are named <event name>.<case>.json. With --check, the operations sent for
+every fixture are compared with fixtures/events/expected.json, which --record rewrites.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+
+from fake_server import SyntheticProject, start_server
+from run_benchmark import run_action
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'events')
+EXPECTED_PATH = os.path.join(FIXTURES_DIR, 'expected.json')
+
+
+def replay(path, args):
+    """
+    Run the action for one event payload against a fresh fake server
+    """
+    event_name = os.path.basename(path).split('.')[0]
+    project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=0.5, seed=args.seed)
+    server = start_server(project, latency=args.latency_ms / 1000, seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as workspace:
+        exit_code, wall_time, _, output = run_action(server, args, workspace, extra_env={
+            'GITHUB_EVENT_NAME': event_name,
+            'GITHUB_EVENT_PATH': os.path.abspath(path),
+            'INPUT_MODE': 'auto'
+        })
+    server.shutdown()
+
+    return exit_code, wall_time, server.stats, output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fixtures', nargs='*', help='Event payloads to replay, all the fixtures by default')
+    parser.add_argument('--items', type=int, default=1000, help='Items of the project, which the event mode never reads')
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--env', action='append', default=[], help='Extra KEY=VALUE passed to the action')
+    parser.add_argument('--check', action='store_true', help='Compare the operations with the expected ones')
+    parser.add_argument('--record', action='store_true', help='Record the operations as the expected ones')
+    parser.add_argument('--show-output', action='store_true')
+    args = parser.parse_args()
+
+    # Same pacing as run_benchmark.py, to measure the action itself
+    args.async_mode = False
+    args.write_interval = 0
+    args.secondary_points_per_minute = 1000000
+
+    paths = args.fixtures or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.*.json')))
+    expected = {}
+    if args.check and os.path.exists(EXPECTED_PATH):
+        with open(EXPECTED_PATH) as f:
+            expected = json.load(f)
+
+    recorded = {}
+    failures = 0
+    for path in paths:
+        name = os.path.basename(path)
+        exit_code, wall_time, stats, output = replay(path, args)
+        recorded[name] = stats['operations']
+
+        status = 'ok'
+        if exit_code:
+            status = f'exit code {exit_code}'
+        elif args.check and expected.get(name) != stats['operations']:
+            status = f"expected {expected.get(name)}"
+        if status != 'ok':
+            failures += 1
+
+        print(f"{name:<48} {wall_time:6.2f}s | {stats['requests']:3} requests | {status}")
+        if args.show_output or exit_code:
+            print(output)
+
+    if args.record:
+        with open(EXPECTED_PATH, 'w') as f:
+            json.dump(recorded, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
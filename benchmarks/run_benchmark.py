@@ -0,0 +1,181 @@
+"""
+Run main.py end to end against the fake GraphQL server and report wall time,
+request count, bytes transferred and peak RSS.
+
+    python benchmarks/run_benchmark.py --items 5000 --latency-ms 10 --label async --async-mode
+    python benchmarks/run_benchmark.py --items 5000 --compare benchmarks/results/baseline.json
+
+Every run is appended to benchmarks/results/<label>.json, so that the results of
+two versions can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import SRC_DIR
+from fake_server import SyntheticProject, start_server
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_action(server, args, workspace, extra_env=None):
+    """
+    Run main.py in a child process and return its exit code, wall time, peak RSS and output
+    """
+    env = dict(os.environ)
+    env.update({
+        'GITHUB_REPOSITORY_OWNER': 'benchmark',
+        'INPUT_REPOSITORY_OWNER_TYPE': 'organization',
+        'GITHUB_SERVER_URL': 'http://127.0.0.1',
+        'GITHUB_GRAPHQL_URL': server.url,
+        'GITHUB_WORKSPACE': workspace,
+        'INPUT_GH_TOKEN': 'benchmark-token',
+        'INPUT_PROJECT_NUMBER': '1',
+        'INPUT_DUEDATE_FIELD_NAME': 'Due Date',
+        'INPUT_COMMENTS_ISSUE_NUMBER': 'False',
+        'INPUT_COMMENTS_ISSUE_REPO': 'False',
+        'INPUT_DRY_RUN': str(args.dry_run),
+        'INPUT_ASYNC_MODE': str(args.async_mode),
+        'INPUT_WRITE_INTERVAL': str(args.write_interval),
+        'INPUT_SECONDARY_POINTS_PER_MINUTE': str(args.secondary_points_per_minute),
+        'PYTHONPATH': SRC_DIR,
+    })
+    env.update(extra_env or {})
+    for assignment in args.env:
+        key, _, value = assignment.partition('=')
+        env[key] = value
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SRC_DIR, 'main.py')],
+        cwd=workspace,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+    return os.waitstatus_to_exitcode(status), wall_time, peak_rss, output
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)[-1]
+
+
+def compare(result, baseline, path):
+    print(f"\nCompared to {path} ({baseline.get('revision')}):")
+    for key in ('wall_time', 'requests', 'bytes_downloaded', 'bytes_uploaded', 'peak_rss'):
+        before = baseline['metrics'][key]
+        after = result['metrics'][key]
+        change = (after - before) / before * 100 if before else 0
+        print(f'  {key:<16} {before:>14,.2f} -> {after:>14,.2f}  ({change:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=10)
+    parser.add_argument('--closed-ratio', type=float, default=0.5)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--no-items-query', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--async-mode', action='store_true')
+    parser.add_argument('--write-interval', type=float, default=0,
+                        help='Minimum seconds between mutations, 0 to measure the action itself')
+    parser.add_argument('--secondary-points-per-minute', type=int, default=1000000,
+                        help='Secondary rate limit pacing, unbounded by default to measure the action itself')
+    parser.add_argument('--env', action='append', default=[], help='Extra KEY=VALUE passed to the action')
+    parser.add_argument('--label', default='benchmark')
+    parser.add_argument('--compare', help='A results file to compare the run with')
+    parser.add_argument('--show-output', action='store_true')
+    args = parser.parse_args()
+
+    # Read the baseline first, as it may be the file this run is appended to
+    baseline = load_baseline(args.compare) if args.compare else None
+
+    project = SyntheticProject(items=args.items, comments=args.comments, closed_ratio=args.closed_ratio, seed=args.seed)
+    server = start_server(
+        project,
+        latency=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        items_query=not args.no_items_query,
+        seed=args.seed
+    )
+
+    with tempfile.TemporaryDirectory() as workspace:
+        exit_code, wall_time, peak_rss, output = run_action(server, args, workspace)
+    server.shutdown()
+
+    if args.show_output or exit_code:
+        print(output)
+
+    stats = server.stats
+    result = {
+        'label': args.label,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'parameters': {
+            'items': args.items,
+            'comments': args.comments,
+            'closed_ratio': args.closed_ratio,
+            'latency_ms': args.latency_ms,
+            'error_rate': args.error_rate,
+            'dry_run': args.dry_run,
+            'async_mode': args.async_mode,
+            'env': args.env
+        },
+        'metrics': {
+            'exit_code': exit_code,
+            'wall_time': round(wall_time, 3),
+            'requests': stats['requests'],
+            'bytes_downloaded': stats['bytes_sent'],
+            'bytes_uploaded': stats['bytes_received'],
+            'errors_injected': stats['errors_injected'],
+            'peak_rss': peak_rss,
+            'operations': stats['operations']
+        }
+    }
+
+    print(f"{args.label}: exit code {exit_code} | {wall_time:.2f}s | {stats['requests']} requests | "
+          f"{stats['bytes_sent']:,} bytes downloaded | {stats['bytes_received']:,} bytes uploaded | "
+          f"peak RSS {peak_rss / 1024 / 1024:.1f} MiB")
+    print(json.dumps(stats['operations'], indent=2, sort_keys=True))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'{args.label}.json')
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history.append(result)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+
+    if baseline:
+        compare(result, baseline, args.compare)
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import json
+import os
+import time
+from datetime import timedelta
+import config
+import graphql
+import utils
+from logger import logger
+
+
+def shard_suffix():
+    """
+    The suffix of the cache files that belong to one shard of the sweep, as every shard
+    keeps its own snapshot and marker index
+    """
+    return f'-shard-{config.shard_index}-of-{config.shard_count}' if config.shard_count > 1 else ''
+
+
+def schema_path(owner, project_number):
+    return os.path.join(config.cache_dir, f'schema-{owner}-{project_number}.json')
+
+
+def read_json(path):
+    """
+    Return the content of a cache file, or None if it is missing or unreadable
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    """
+    Write a cache file atomically, so that concurrent runs never read a partial file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def get_project(organization_name, project_number, owner_type='organization'):
+    """
+    Return the project schema (fields, options and iterations).
+
+    The schema is cached on disk per owner and project number. A cached schema
+    younger than the TTL is used as long as the cheap fingerprint of the project
+    fields still matches, otherwise the full schema is fetched again.
+    """
+    if not config.cache_dir:
+        return graphql.get_project(organization_name=organization_name, project_number=project_number, owner_type=owner_type)
+
+    path = schema_path(organization_name, project_number)
+    cached = read_json(path)
+
+    if cached and time.time() - cached['fetched_at'] < config.schema_cache_ttl:
+        version = graphql.get_project_fields_version(
+            organization_name=organization_name,
+            project_number=project_number,
+            owner_type=owner_type
+        )
+        if version == cached['version']:
+            logger.info(f'Using the cached project schema from {path}')
+            return cached['project']
+
+    project = graphql.get_project(organization_name=organization_name, project_number=project_number, owner_type=owner_type)
+
+    write_json(path, {
+        'fetched_at': time.time(),
+        'version': graphql.fields_version(project),
+        'project': project
+    })
+
+    return project
+
+
+class ItemSnapshot:
+    """
+    The relevant field values of every item seen by the last run, so that an
+    incremental run only evaluates the items that changed since then.
+
+    The snapshot is discarded, forcing a full rescan, when the project fields
+    changed or a new week started, as both change the resolution of every item.
+    """
+
+    def __init__(self, owner, project_number, project, today):
+        self.path = os.path.join(config.cache_dir, f'snapshot-{owner}-{project_number}{shard_suffix()}.json')
+        self.context = {
+            'week_of': (today - timedelta(days=today.weekday())).isoformat(),
+            'schema': graphql.fields_version(project)
+        }
+
+        previous = None if config.full_rescan else read_json(self.path)
+        if previous and previous.get('context') == self.context:
+            self.previous = previous['items']
+        else:
+            logger.info('Incremental mode: running a full rescan')
+            self.previous = {}
+
+        self.current = {}
+        self.seen = 0
+        self.changed = 0
+        # A run resumed from the journal does not see the items of the pages before its checkpoint
+        self.keep_unseen = False
+
+    @staticmethod
+    def signature(item):
+        return [
+            item.due_date.isoformat() if item.due_date else None,
+            item.estimate,
+            item.week_id,
+            item.release_id,
+            item.size_id
+        ]
+
+    def filter_changed(self, items):
+        """
+        Record the items and return the ones whose field values differ from the snapshot
+        """
+        changed = []
+        for item in items:
+            signature = self.signature(item)
+            self.current[item.id] = signature
+            if self.previous.get(item.id) != signature:
+                changed.append(item)
+
+        self.seen += len(items)
+        self.changed += len(changed)
+
+        return changed
+
+    def discard(self, item_ids):
+        """
+        Forget the items whose writes failed or could not be decided, so that the next run sees them as changed
+        """
+        for item_id in item_ids:
+            self.current.pop(item_id, None)
+            self.previous.pop(item_id, None)
+
+    def save(self):
+        logger.info(f'Incremental mode: {self.changed} of {self.seen} items changed since the last run')
+        items = dict(self.previous, **self.current) if self.keep_unseen else self.current
+        write_json(self.path, {'context': self.context, 'items': items})
+
+
+class MarkerIndex:
+    """
+    The markers of the comments written by the action, keeping the latest value hash
+    of every item field, so that a run knows which notices it already sent without
+    reading the comments of the items.
+    """
+
+    def __init__(self, owner, project_number):
+        self.path = os.path.join(config.cache_dir, f'markers-{owner}-{project_number}{shard_suffix()}.json')
+        self.markers = read_json(self.path) or {}
+        self.recorded = 0
+
+    def announced(self, marker):
+        """
+        Whether the latest comment recorded for the item field of the marker announces its value
+        """
+        markers = utils.comment_markers(marker)
+        return bool(markers) and all(
+            self.markers.get(f'{item_id}:{field}') == value_hash
+            for field, item_id, value_hash in markers
+        )
+
+    def record(self, comment):
+        """
+        Record the markers of a comment that was written
+        """
+        for field, item_id, value_hash in utils.comment_markers(comment):
+            self.markers[f'{item_id}:{field}'] = value_hash
+            self.recorded += 1
+
+    def save(self):
+        logger.info(f'Marker index: {self.recorded} markers recorded, {len(self.markers)} in total')
+        write_json(self.path, self.markers)
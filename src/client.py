@@ -0,0 +1,251 @@
+import asyncio
+import re
+import threading
+import time
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from logger import logger
+from ratelimit import RateLimitScheduler
+from retry import CircuitBreaker, RetryPolicy, is_transient
+from tokens import TokenPool
+
+
+OPERATION_NAME = re.compile(r'^\s*(?:query|mutation)\s+(\w+)')
+
+
+def is_mutation(query):
+    return query.lstrip().startswith('mutation')
+
+
+def operation_name(query):
+    match = OPERATION_NAME.match(query)
+    return match.group(1) if match else 'anonymous'
+
+
+class DecodedResponse(requests.Response):
+    """
+    A response whose JSON body is decoded at most once, as both the metrics of the
+    request and its caller read it
+    """
+
+    def json(self, **kwargs):
+        if '_decoded' not in self.__dict__:
+            self._decoded = super().json(**kwargs)
+        return self._decoded
+
+
+def response_cost(query, response):
+    """
+    The GraphQL point cost of a response: the rateLimit cost when the query selected it,
+    one point otherwise, as for mutations and small queries
+    """
+    if response is None or response.status_code != 200:
+        return 0
+
+    if b'"rateLimit"' in response.content:
+        try:
+            return response.json()['data']['rateLimit']['cost']
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    return 1
+
+
+class GraphQLClient:
+    """
+    GraphQL client that owns a pooled keep-alive HTTP session.
+    All the requests of a run share the same connections.
+
+    Given several tokens, the requests are spread over them by a TokenPool, every
+    token with its own scheduler made by scheduler_factory.
+
+    The failures that may pass are retried under the retry policy, and a circuit breaker
+    shared by all the requests backs off from an API that keeps failing.
+    """
+
+    def __init__(self, endpoint, token, pool_size=10, timeout=30, scheduler=None, max_rate_limit_retries=5, hooks=None,
+                 scheduler_factory=None, retry_policy=None, breaker=None):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+
+        tokens = [token] if isinstance(token, str) else list(token)
+        if scheduler_factory is None:
+            scheduler_factory = (lambda: scheduler) if scheduler and len(tokens) == 1 else RateLimitScheduler
+        self.tokens = TokenPool(tokens, scheduler_factory)
+
+        # Callables receiving a record of every request, see _notify
+        self.hooks = list(hooks or [])
+
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json"
+        })
+
+    def post(self, query, variables=None, affinity=None, token=None, idempotent=None, function=None):
+        """
+        Send a GraphQL document and return the raw response.
+        The request is paced by the scheduler of its token and retried when it is rate limited,
+        with another token of the pool if one has points left. Server errors and timeouts are
+        retried with the backoff of the retry policy, unless the request is not idempotent.
+
+        :param affinity: A key, such as an issue ID, whose requests are sent with the same token
+        :param token: A PooledToken the request has to be sent with, such as the author of a comment to edit
+        :param idempotent: Whether sending the request twice is harmless, by default only for queries
+        :param function: The name the request is recorded under, by default the operation name of the document
+        :raise requests.RequestException: When the request could not be sent, after its retries
+        """
+        pinned = token is not None
+        write = is_mutation(query)
+        if idempotent is None:
+            idempotent = not write
+
+        function = function or operation_name(query)
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.retry_policy.deadline
+        response = None
+        attempt = 0
+        rate_limit_retries = 0
+        failures = 0
+
+        try:
+            if not pinned:
+                token = self.tokens.acquire(affinity)
+            while True:
+                self.breaker.wait(deadline)
+                token.scheduler.wait(write=write)
+
+                try:
+                    response = self.session.post(
+                        self.endpoint,
+                        json={"query": query, "variables": variables or {}},
+                        headers=token.headers,
+                        timeout=self.timeout
+                    )
+                    response.__class__ = DecodedResponse
+                except requests.RequestException as e:
+                    self.breaker.failure()
+                    # A request that could not even connect cannot have been applied
+                    if not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                        raise
+                    if not self.retry_policy.backoff(failures, deadline):
+                        raise
+                    logger.info(f'Request failed ({e}), retrying')
+                    attempt += 1
+                    failures += 1
+                    continue
+
+                delay = token.scheduler.update(response)
+                if delay is None and is_transient(response):
+                    self.breaker.failure()
+                    if not idempotent or not self.retry_policy.backoff(failures, deadline):
+                        return response
+                    logger.info(f'Request failed with HTTP {response.status_code}, retrying')
+                    attempt += 1
+                    failures += 1
+                    continue
+
+                self.breaker.success()
+                if delay is None or rate_limit_retries == self.max_rate_limit_retries:
+                    return response
+
+                # The scheduler of the token waits for the delay before its next request
+                attempt += 1
+                rate_limit_retries += 1
+                limited = token
+                if not pinned:
+                    token = self.tokens.acquire(affinity)
+                if token is limited:
+                    logger.info(f'Rate limited, retrying in {delay:.0f} seconds')
+                else:
+                    logger.info(f'Rate limited on {limited.name}, retrying with {token.name}')
+        finally:
+            self._notify(function, query, response, time.perf_counter() - start, attempt)
+
+    def _notify(self, function, query, response, latency, retries):
+        if not self.hooks:
+            return
+
+        record = {
+            'function': function,
+            'operation': operation_name(query),
+            'latency': latency,
+            'retries': retries,
+            'request_bytes': len(response.request.body or b'') if response is not None else 0,
+            'response_bytes': len(response.content) if response is not None else 0,
+            'cost': response_cost(query, response),
+            'error': response is None or response.status_code != 200 or b'"errors"' in response.content
+        }
+        for hook in self.hooks:
+            hook(record)
+
+    def connection_stats(self):
+        """
+        Return the number of requests sent and how many of them reused a pooled connection
+        """
+        pools = self.adapter.poolmanager.pools
+
+        requests_sent = 0
+        new_connections = 0
+        for key in pools.keys():
+            pool = pools[key]
+            if pool is None:
+                continue
+            requests_sent += pool.num_requests
+            new_connections += pool.num_connections
+
+        return {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': requests_sent - new_connections
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGraphQLClient:
+    """
+    Asynchronous front of a GraphQLClient. The requests run in worker threads over
+    the shared pooled session, with separate concurrency caps for reads and writes.
+
+    The caps belong to the running event loop, as the projects of a run are processed
+    in their own threads, each with its own loop.
+    """
+
+    def __init__(self, client, read_concurrency=4, write_concurrency=2):
+        self.client = client
+        self.read_concurrency = read_concurrency
+        self.write_concurrency = write_concurrency
+        self.lock = threading.Lock()
+        self.caps = weakref.WeakKeyDictionary()
+
+    def loop_caps(self):
+        """
+        Return the (reads, writes) semaphores of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            caps = self.caps.get(loop)
+            if caps is None:
+                caps = self.caps[loop] = (
+                    asyncio.Semaphore(self.read_concurrency),
+                    asyncio.Semaphore(self.write_concurrency)
+                )
+
+        return caps
+
+    async def call(self, func, *args, write=False, **kwargs):
+        """
+        Run a blocking function, such as one of graphql.py, under the read or the write cap
+        """
+        reads, writes = self.loop_caps()
+        async with (writes if write else reads):
+            return await asyncio.to_thread(func, *args, **kwargs)
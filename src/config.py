@@ -8,10 +8,65 @@ is_enterprise = True if os.environ.get('INPUT_ENTERPRISE_GITHUB') == 'True' else
 dry_run = True if os.environ.get('INPUT_DRY_RUN') == 'True' else False
 
 gh_token = os.environ['INPUT_GH_TOKEN']
-project_number = int(os.environ['INPUT_PROJECT_NUMBER'])
+gh_tokens = [token.strip() for token in (os.environ.get('INPUT_GH_TOKENS') or '').replace('\n', ',').split(',') if token.strip()]
+project_number = int(os.environ.get('INPUT_PROJECT_NUMBER') or 0)
 api_endpoint = os.environ['GITHUB_GRAPHQL_URL']
 
 comments_issue_number = 0 if os.environ.get('INPUT_COMMENTS_ISSUE_NUMBER') == 'False' else int(os.environ.get('INPUT_COMMENTS_ISSUE_NUMBER'))
 comments_issue_repo = False if os.environ.get('INPUT_COMMENTS_ISSUE_REPO') == 'False' else os.environ.get('INPUT_COMMENTS_ISSUE_REPO')
 
 duedate_field_name = os.environ['INPUT_DUEDATE_FIELD_NAME']
+
+projects = os.environ.get('INPUT_PROJECTS') or ''
+project_concurrency = int(os.environ.get('INPUT_PROJECT_CONCURRENCY') or 2)
+
+pool_size = int(os.environ.get('INPUT_POOL_SIZE') or 10)
+request_timeout = float(os.environ.get('INPUT_REQUEST_TIMEOUT') or 30)
+max_retries = int(os.environ.get('INPUT_MAX_RETRIES') or 4)
+retry_deadline = float(os.environ.get('INPUT_RETRY_DEADLINE') or 120)
+circuit_breaker_threshold = int(os.environ.get('INPUT_CIRCUIT_BREAKER_THRESHOLD') or 5)
+circuit_breaker_cooldown = float(os.environ.get('INPUT_CIRCUIT_BREAKER_COOLDOWN') or 10)
+mutation_batch_size = int(os.environ.get('INPUT_MUTATION_BATCH_SIZE') or 50)
+prefetch_pages = int(os.environ.get('INPUT_PREFETCH_PAGES') or 1)
+
+async_mode = True if os.environ.get('INPUT_ASYNC_MODE') == 'True' else False
+read_concurrency = int(os.environ.get('INPUT_READ_CONCURRENCY') or 4)
+write_concurrency = int(os.environ.get('INPUT_WRITE_CONCURRENCY') or 2)
+
+rate_limit_reserve = int(os.environ.get('INPUT_RATE_LIMIT_RESERVE') or 100)
+secondary_points_per_minute = int(os.environ.get('INPUT_SECONDARY_POINTS_PER_MINUTE') or 1500)
+write_interval = float(os.environ.get('INPUT_WRITE_INTERVAL') or 1.0)
+
+cache_dir = False if os.environ.get('INPUT_CACHE_DIR', 'False') in ('', 'False') else os.path.join(
+    os.environ.get('GITHUB_WORKSPACE', '.'),
+    os.environ.get('INPUT_CACHE_DIR')
+)
+schema_cache_ttl = int(os.environ.get('INPUT_SCHEMA_CACHE_TTL') or 86400)
+
+incremental = True if os.environ.get('INPUT_INCREMENTAL') == 'True' else False
+full_rescan = True if os.environ.get('INPUT_FULL_RESCAN') == 'True' else False
+journal = True if os.environ.get('INPUT_JOURNAL') == 'True' else False
+
+release_field_name = os.environ.get('INPUT_RELEASE_FIELD_NAME') or 'Release'
+week_field_name = os.environ.get('INPUT_WEEK_FIELD_NAME') or 'Week'
+size_field_name = os.environ.get('INPUT_SIZE_FIELD_NAME') or 'Size'
+estimate_field_name = os.environ.get('INPUT_ESTIMATE_FIELD_NAME') or 'Estimate'
+
+comments_digest = True if os.environ.get('INPUT_COMMENTS_DIGEST') == 'True' else False
+comments_digest_group_by = os.environ.get('INPUT_COMMENTS_DIGEST_GROUP_BY') or 'field'
+comments_digest_rolling = True if os.environ.get('INPUT_COMMENTS_DIGEST_ROLLING') == 'True' else False
+
+run_mode = os.environ.get('INPUT_MODE') or 'auto'
+event_name = os.environ.get('GITHUB_EVENT_NAME')
+event_path = os.environ.get('GITHUB_EVENT_PATH')
+
+shard_index = int(os.environ.get('INPUT_SHARD_INDEX') or 0)
+shard_count = int(os.environ.get('INPUT_SHARD_COUNT') or 1)
+shard_results_dir = os.path.join(
+    os.environ.get('GITHUB_WORKSPACE', '.'),
+    os.environ.get('INPUT_SHARD_RESULTS_DIR') or 'shard-results'
+)
+plan_path = os.path.join(
+    os.environ.get('GITHUB_WORKSPACE', '.'),
+    os.environ.get('INPUT_PLAN_PATH') or 'project-automations-plan.json'
+)
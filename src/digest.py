@@ -0,0 +1,158 @@
+import threading
+from datetime import datetime
+import graphql
+import utils
+from logger import logger
+
+# GitHub rejects comment bodies longer than this
+MAX_COMMENT_LENGTH = 65536
+
+# Hidden marker of the digest comments, to find the rolling comment again
+DIGEST_MARKER = '<!-- project-automations:digest -->'
+
+# Field of the marker of every posted part, so that a failed post is checked without reading the whole issue
+DIGEST_MARKER_FIELD = 'digest'
+
+# Room left in every part for its header and the truncation note
+HEADER_RESERVE = 512
+
+
+class CommentDigest:
+    """
+    Collects the summaries of the updated items during a run, to post them to the
+    comments issue at the end as a few comments instead of one comment per item
+    """
+
+    def __init__(self, group_by='field', rolling=False, max_length=MAX_COMMENT_LENGTH):
+        if group_by not in ('field', 'assignee'):
+            logger.error(f"Unknown digest grouping {group_by}, grouping by field")
+            group_by = 'field'
+
+        self.group_by = group_by
+        self.rolling = rolling
+        self.max_length = max_length
+
+        self.lock = threading.Lock()
+        self.items = []
+
+    def add(self, issue, fields):
+        """
+        Record the updated fields of the issue of an item, as a list of {'field', 'value'}
+        """
+        with self.lock:
+            self.items.append({
+                'url': issue.url,
+                'number': issue.number or 0,
+                'assignees': issue.assignees,
+                'fields': fields
+            })
+
+    def merge(self, items):
+        """
+        Add the items recorded by another run, such as a shard of the sweep
+        """
+        with self.lock:
+            self.items.extend(items)
+
+    def groups(self):
+        """
+        Return the (heading, lines) sections of the digest, in a stable order
+        """
+        items = sorted(self.items, key=lambda item: (item['url'].rsplit('/', 1)[0], item['number']))
+
+        sections = {}
+        for item in items:
+            if self.group_by == 'assignee':
+                line = f"- {item['url']}: " + ', '.join(f"{field['field']} **{field['value']}**" for field in item['fields'])
+                for login in item['assignees'] or [None]:
+                    heading = f'@{login}' if login else 'Unassigned'
+                    sections.setdefault(heading, []).append(line)
+            else:
+                for field in item['fields']:
+                    sections.setdefault(field['field'], []).append(f"- {item['url']}: **{field['value']}**")
+
+        # Unassigned items come last
+        return sorted(sections.items(), key=lambda section: (section[0] == 'Unassigned', section[0].lower()))
+
+    def bodies(self, today=None):
+        """
+        Render the digest as comment bodies that each fit in a GitHub comment
+        """
+        today = today or datetime.today().date()
+        limit = self.max_length - HEADER_RESERVE
+
+        parts = []
+        current = []
+        size = 0
+        for heading, lines in self.groups():
+            heading_line = f'\n### {heading}\n'
+            for position, line in enumerate(lines):
+                block = [heading_line, line] if position == 0 else [line]
+                if current and size + sum(len(text) + 1 for text in block) > limit:
+                    parts.append(current)
+                    # A section that goes on in the next part repeats its heading
+                    current = [f'\n### {heading} (continued)\n'] if position else []
+                    size = sum(len(text) + 1 for text in current)
+                current += block
+                size += sum(len(text) + 1 for text in block)
+        if current:
+            parts.append(current)
+
+        bodies = []
+        for index, part in enumerate(parts):
+            header = f'{DIGEST_MARKER}\n## Project automation digest of {today.strftime("%b %d, %Y")}'
+            if len(parts) > 1:
+                header += f' ({index + 1}/{len(parts)})'
+            header += f'\n{len(self.items)} items have been updated.\n'
+
+            bodies.append(header + '\n'.join(part))
+
+        return bodies
+
+    def publish(self, comments_issue, dry_run=False):
+        """
+        Post the digest to the comments issue, or update the rolling comment in place.
+        Return False if a part of the digest could not be written.
+        """
+        if not self.items:
+            return True
+
+        bodies = self.bodies()
+
+        # The rolling comment only holds the first part, the rest goes to the logs
+        if self.rolling and len(bodies) > 1:
+            for body in bodies[1:]:
+                logger.info(f"Digest part that does not fit in the rolling comment:\n{body}")
+            bodies = [bodies[0] + f'\n\n_{len(bodies) - 1} more parts do not fit in this comment, see the logs of the run._']
+
+        if dry_run:
+            for body in bodies:
+                logger.info(f"DRY RUN: Digest comment prepared for the comments issue with comment {body}")
+            return True
+
+        if self.rolling:
+            rolling_comment = graphql.get_latest_matching_comment(
+                issue_id=comments_issue['id'],
+                contains=DIGEST_MARKER,
+                author_login=graphql.get_viewer_logins()
+            )
+            if rolling_comment:
+                updated = graphql.update_issue_comment(
+                    rolling_comment['id'], bodies[0], author_login=(rolling_comment.get('author') or {}).get('login')
+                )
+                if updated:
+                    logger.info(f"Digest of {len(self.items)} items updated in comment {rolling_comment['id']}")
+                else:
+                    logger.error(f"Digest of {len(self.items)} items could not be updated in comment {rolling_comment['id']}")
+                return bool(updated)
+
+        posted = 0
+        for body in bodies:
+            marker = utils.comment_marker(DIGEST_MARKER_FIELD, comments_issue['id'], body)
+            posted += utils.post_comment(comments_issue['id'], f'{body}\n{marker}')
+        if posted < len(bodies):
+            logger.error(f"Digest of {len(self.items)} items: {len(bodies) - posted} of {len(bodies)} comments could not be added")
+            return False
+
+        logger.info(f"Digest of {len(self.items)} items added to the comments issue in {len(bodies)} comments")
+        return True
@@ -0,0 +1,77 @@
+import json
+import config
+import graphql
+from logger import logger
+
+# The events about a single project item, handled without sweeping the project
+ITEM_EVENTS = ('projects_v2_item', 'issues')
+
+# The actions after which there is nothing left to resolve on the item
+IGNORED_ACTIONS = {
+    'projects_v2_item': ('deleted', 'archived'),
+    'issues': ('closed', 'deleted', 'transferred', 'locked', 'unlocked', 'pinned', 'unpinned')
+}
+
+
+def event_mode():
+    """
+    Whether the run only processes the item of the event that triggered it
+    """
+    if config.run_mode == 'sweep':
+        return False
+    if config.run_mode == 'event':
+        return True
+
+    return config.event_name in ITEM_EVENTS and bool(config.event_path)
+
+
+def load_event(path=None):
+    """
+    Read the payload of the event that triggered the workflow
+    """
+    with open(path or config.event_path) as f:
+        return json.load(f)
+
+
+def event_item(event_name, payload, project_id):
+    """
+    Fetch the project item an event is about.
+
+    :return: The ProjectItem, or None when the event is not about an open issue of the project
+    """
+    action = payload.get('action')
+    if event_name not in ITEM_EVENTS:
+        logger.info(f'The {event_name} event is not about a project item, nothing to do')
+        return None
+    if action in IGNORED_ACTIONS[event_name]:
+        logger.info(f'Ignoring the {event_name} event with action {action}')
+        return None
+
+    if event_name == 'projects_v2_item':
+        item = payload.get('projects_v2_item') or {}
+        if item.get('project_node_id') != project_id:
+            logger.info(f"Item {item.get('node_id')} belongs to another project, nothing to do")
+            return None
+        if item.get('content_type') != 'Issue':
+            logger.info(f"Item {item.get('node_id')} is a {item.get('content_type')}, not an issue, nothing to do")
+            return None
+
+        projectItem = graphql.get_project_item(item['node_id'])
+    else:
+        issue = payload.get('issue') or {}
+        if issue.get('state') == 'closed':
+            logger.info(f"Issue {issue.get('html_url')} is closed, nothing to do")
+            return None
+
+        projectItem = graphql.get_issue_project_item(issue.get('node_id'), project_id)
+
+    if not projectItem or not projectItem.issue:
+        logger.info(f'The {event_name} event is not about an issue of the project, nothing to do')
+        return None
+
+    # Like the sweep, only the open issues are processed
+    if projectItem.issue.state != 'OPEN':
+        logger.info(f'Issue {projectItem.issue.url} is closed, nothing to do')
+        return None
+
+    return projectItem
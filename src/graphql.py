@@ -1,184 +1,549 @@
+import contextlib
+import functools
 import requests
 import config
+from client import AsyncGraphQLClient, GraphQLClient
 from logger import logger
+from metrics import run_metrics
+from model import ProjectItem
+from ratelimit import RateLimitScheduler
+from retry import CircuitBreaker, RetryPolicy, TransientError, is_transient
+
+
+client = GraphQLClient(
+    endpoint=config.api_endpoint,
+    token=[config.gh_token] + config.gh_tokens,
+    pool_size=config.pool_size,
+    timeout=config.request_timeout,
+    scheduler_factory=lambda: RateLimitScheduler(
+        reserve=config.rate_limit_reserve,
+        points_per_minute=config.secondary_points_per_minute,
+        write_interval=config.write_interval
+    ),
+    retry_policy=RetryPolicy(max_retries=config.max_retries, deadline=config.retry_deadline),
+    breaker=CircuitBreaker(
+        threshold=config.circuit_breaker_threshold,
+        cooldown=config.circuit_breaker_cooldown,
+        patience=config.retry_deadline
+    ),
+    hooks=[run_metrics.record]
+)
+
+async_client = AsyncGraphQLClient(
+    client=client,
+    read_concurrency=config.read_concurrency,
+    write_concurrency=config.write_concurrency
+)
+
+# Upper bound of aliased mutations in a single document, to stay well within
+# the node and complexity limits of the GitHub GraphQL API
+MAX_MUTATION_BATCH_SIZE = 100
+
+# Number of issues whose comments are read with a single aliased query
+COMMENT_LOOKUP_BATCH_SIZE = 50
+
+
+class UnsupportedItemsQuery(Exception):
+    """
+    Raised when the API does not accept a search query on the project items
+    """
+
+
+class ProjectReadError(Exception):
+    """
+    Raised when data the run cannot go on without, such as the project schema or a page
+    of its items, could not be read after the retries of the request
+    """
+
+
+@contextlib.contextmanager
+def _reading(what):
+    """
+    Turn the failure of a query whose data the run needs, sent in the block, into a ProjectReadError
+
+    :raise ProjectReadError: When the request failed after its retries
+    """
+    try:
+        yield
+    except (requests.RequestException, ValueError) as e:
+        raise ProjectReadError(f'Could not read {what}: {e}') from e
+
+
+def _owner_project(data, owner_type, what):
+    """
+    Return the projectV2 of the owner in a response body
+
+    :raise ProjectReadError: When the response has no project, as when the API failed
+    """
+    project = ((data.get('data') or {}).get(owner_type) or {}).get('projectV2')
+    if project is None:
+        raise ProjectReadError(f'Could not read {what}: {data.get("errors")}')
+
+    return project
 
 
-def get_project(organization_name, project_number):
+def get_project(organization_name, project_number, owner_type='organization'):
     # GraphQL query
-    query = """
-    query($organization: String!, $projectNumber: Int!) {
-        organization(login: $organization) {
-            projectV2(number: $projectNumber) {
+    query = f"""
+    query GetProject($organization: String!, $projectNumber: Int!) {{
+        {owner_type}(login: $organization) {{
+            projectV2(number: $projectNumber) {{
               id
-              fields(first: 100) {
-                nodes {
-                  ... on ProjectV2SingleSelectField {
+              fields(first: 100) {{
+                nodes {{
+                  ... on ProjectV2FieldCommon {{
                     id
                     name
-                    options {
+                    updatedAt
+                  }}
+                  ... on ProjectV2SingleSelectField {{
+                    id
+                    name
+                    options {{
                         id
                         name
-                    }
-                  }
-                  ... on ProjectV2IterationField {
+                    }}
+                  }}
+                  ... on ProjectV2IterationField {{
                     id
                     name
-                    configuration {
-                        iterations {
+                    configuration {{
+                        iterations {{
                             id
                             title
                             startDate
                             duration
-                        }
-                        completedIterations {
+                        }}
+                        completedIterations {{
                             id
                             title
                             startDate
                             duration
-                        }
-                    }
-                  }
-                }
-              }
-            }
-        }
+                        }}
+                    }}
+                  }}
+                }}
+              }}
+            }}
+        }}
+    }}
+    """
+
+    variables = {
+        'organization': organization_name,
+        'projectNumber': project_number
     }
+    with _reading(f'the project {organization_name}/{project_number}'):
+        data = client.post(query, variables, function='get_project').json()
+
+    return _owner_project(data, owner_type, f'the project {organization_name}/{project_number}')
+
+
+def get_project_fields_version(organization_name, project_number, owner_type='organization'):
+    """
+    Return a cheap fingerprint of the project fields, that changes whenever a field
+    definition, its options or its iterations are updated
+    """
+    query = f"""
+    query GetProjectFieldsVersion($organization: String!, $projectNumber: Int!) {{
+        {owner_type}(login: $organization) {{
+            projectV2(number: $projectNumber) {{
+              fields(first: 100) {{
+                nodes {{
+                  ... on ProjectV2FieldCommon {{
+                    id
+                    updatedAt
+                  }}
+                }}
+              }}
+            }}
+        }}
+    }}
     """
 
     variables = {
         'organization': organization_name,
         'projectNumber': project_number
     }
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": query, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
+    with _reading(f'the fields of the project {organization_name}/{project_number}'):
+        data = client.post(query, variables, function='get_project_fields_version').json()
+
+    return fields_version(_owner_project(data, owner_type, f'the fields of the project {organization_name}/{project_number}'))
+
+
+def fields_version(project):
+    return [
+        [field.get('id'), field.get('updatedAt')]
+        for field in project['fields']['nodes'] if field and field.get('id')
+    ]
+
+
+def get_project_issues(owner, owner_type, project_number, filters=None, after=None):
+    """
+    Return all the items of the project as a list of ProjectItem
+    """
+    stats = {}
+    issues = []
+    for page in iter_project_issue_pages(owner, owner_type, project_number, filters=filters, after=after, stats=stats):
+        issues.extend(page)
+
+    log_download_stats(stats)
+
+    return issues
+
+
+def iter_project_issues(owner, owner_type, project_number, filters=None, after=None):
+    """
+    Yield the items of the project one by one while the pages are fetched
+    """
+    for page in iter_project_issue_pages(owner, owner_type, project_number, filters=filters, after=after):
+        yield from page
+
+
+def iter_project_issue_pages(owner, owner_type, project_number, filters=None, after=None, stats=None, cursors=False):
+    """
+    Yield the items of the project page by page as lists of ProjectItem, fetching the next page
+    only when it is needed.
+
+    The filters are pushed down to the API through the items search query. When the API
+    does not support it, the pages are first read with the state of the items only, and
+    the fields are then fetched just for the items that are kept.
+
+    When given, the stats dictionary is filled with the bytes and the items downloaded and the items kept.
+    With cursors, (page, cursor) pairs are yielded, where the cursor is the one to resume after the page.
+    """
+    pages = _iter_project_issue_pages(owner, owner_type, project_number, filters, after, stats)
+    if cursors:
+        yield from pages
+    else:
+        for page, _ in pages:
+            yield page
+
+
+def _iter_project_issue_pages(owner, owner_type, project_number, filters, after, stats):
+    search = _items_search_query(filters)
+    if stats is None:
+        stats = {}
+    stats.update({'bytes': 0, 'downloaded': 0, 'kept': 0})
+
+    if search:
+        try:
+            yield from _iter_item_pages(owner, owner_type, project_number, filters, after, search, stats)
+            return
+        except UnsupportedItemsQuery:
+            logger.info('The items search query is not supported, filtering the items before fetching their fields')
+
+        yield from _iter_item_pages_by_state(owner, owner_type, project_number, filters, after, stats)
+    else:
+        yield from _iter_item_pages(owner, owner_type, project_number, filters, after, None, stats)
+
+
+def log_download_stats(stats):
+    logger.info(
+        f"Items downloaded: {stats['downloaded']} | "
+        f"Items kept: {stats['kept']} | "
+        f"Bytes downloaded: {stats['bytes']}"
     )
 
-    return response.json().get('data').get('organization').get('projectV2')
 
+# The fields of a project item that the automations work with
+PROJECT_ITEM_FRAGMENT = """
+    fragment ProjectItemFields on ProjectV2Item {
+      id
+      dueDate: fieldValueByName(name: $dueDateField) {
+        ... on ProjectV2ItemFieldDateValue {
+          id
+          date
+        }
+      }
+      release: fieldValueByName(name: $releaseField) {
+        ... on ProjectV2ItemFieldSingleSelectValue {
+          id: optionId
+          name
+        }
+      }
+      week: fieldValueByName(name: $weekField) {
+        ... on ProjectV2ItemFieldIterationValue {
+          id: iterationId
+          title
+          startDate
+          duration
+        }
+      }
+      estimate: fieldValueByName(name: $estimateField) {
+        ... on ProjectV2ItemFieldSingleSelectValue {
+          name
+          id
+        }
+      }
+      size: fieldValueByName(name: $sizeField) {
+        ... on ProjectV2ItemFieldSingleSelectValue {
+          id: optionId
+          name
+        }
+      }
+      content {
+        ... on Issue {
+          id
+          title
+          number
+          state
+          url
+          assignees(first:20) {
+            nodes {
+              name
+              email
+              login
+            }
+          }
+        }
+      }
+    }
+"""
+
+
+# Variables of the field names used by the ProjectItemFields fragment
+ITEM_FIELD_DECLARATIONS = (
+    '$dueDateField: String!, $releaseField: String!, $weekField: String!, '
+    '$estimateField: String!, $sizeField: String!'
+)
+
+
+def _item_field_variables():
+    return {
+        'dueDateField': config.duedate_field_name,
+        'releaseField': config.release_field_name,
+        'weekField': config.week_field_name,
+        'estimateField': config.estimate_field_name,
+        'sizeField': config.size_field_name
+    }
+
+
+def _items_search_query(filters):
+    """
+    Translate the filters to a ProjectV2 items search query
+    """
+    if filters and filters.get('open_only'):
+        return 'is:issue is:open'
+
+    return None
+
+
+def _keep_item(node, filters):
+    if filters and filters.get('open_only') and (node.get('content') or {}).get('state') != 'OPEN':
+        return False
+
+    return True
+
+
+def _iter_item_pages(owner, owner_type, project_number, filters, after, search, stats):
+    query_declaration = ', $query: String' if search else ''
+    query_argument = ', query: $query' if search else ''
 
-def get_project_issues(owner, owner_type, project_number, filters=None, after=None, issues=None):
     query = f"""
-    query GetProjectIssues($owner: String!, $projectNumber: Int!, $after: String)  {{
+    query GetProjectIssues($owner: String!, $projectNumber: Int!, $after: String{query_declaration}, {ITEM_FIELD_DECLARATIONS})  {{
+          rateLimit {{
+            cost
+            remaining
+            resetAt
+          }}
           {owner_type}(login: $owner) {{
             projectV2(number: $projectNumber) {{
               id
               title
               number
+              items(first: 100,after: $after{query_argument}) {{
+                nodes {{
+                  ...ProjectItemFields
+                }}
+                pageInfo {{
+                endCursor
+                hasNextPage
+                hasPreviousPage
+              }}
+              totalCount
+              }}
+            }}
+          }}
+        }}
+    """ + PROJECT_ITEM_FRAGMENT
+
+    variables = {
+        'owner': owner,
+        'projectNumber': project_number,
+        'after': after,
+        **_item_field_variables()
+    }
+    if search:
+        variables['query'] = search
+
+    while True:
+        with _reading(f"the items after cursor {variables['after']}"):
+            response = client.post(query, variables, function='_iter_item_pages')
+            data = response.json()
+        stats['bytes'] += len(response.content)
+
+        errors = data.get('errors')
+        if errors:
+            if search and not data.get('data') and any("'query'" in error.get('message', '') for error in errors):
+                raise UnsupportedItemsQuery()
+            logger.info(errors)
+
+        items = _owner_project(data, owner_type, f"the items after cursor {variables['after']}").get('items')
+        nodes = items.get('nodes')
+        stats['downloaded'] += len(nodes)
+
+        # The search query already filters the items, this keeps the result exact anyway.
+        # The nodes are reduced to compact items, so that the decoded page can be freed
+        page = [ProjectItem.from_node(node) for node in nodes if _keep_item(node, filters)]
+        stats['kept'] += len(page)
+        pageinfo = items.get('pageInfo')
+        del data, items, nodes, response
+
+        yield page, pageinfo.get('endCursor')
+
+        if not pageinfo.get('hasNextPage'):
+            break
+
+        variables['after'] = pageinfo.get('endCursor')
+
+
+def _iter_item_pages_by_state(owner, owner_type, project_number, filters, after, stats):
+    states_query = f"""
+    query GetProjectItemStates($owner: String!, $projectNumber: Int!, $after: String)  {{
+          {owner_type}(login: $owner) {{
+            projectV2(number: $projectNumber) {{
               items(first: 100,after: $after) {{
                 nodes {{
                   id
-                  dueDate: fieldValueByName(name: "Due Date") {{
-                    ... on ProjectV2ItemFieldDateValue {{
-                      id
-                      date
-                    }}
-                  }}
-                  release: fieldValueByName(name: "Release") {{
-                    ... on ProjectV2ItemFieldSingleSelectValue {{
-                      id: optionId
-                      name
-                    }}
-                  }}
-                  week: fieldValueByName(name: "Week") {{
-                    ... on ProjectV2ItemFieldIterationValue {{
-                      id: iterationId
-                      title
-                      startDate
-                      duration
-                    }}
-                  }}
-                  estimate: fieldValueByName(name: "Estimate") {{
-                    ... on ProjectV2ItemFieldSingleSelectValue {{
-                      name
-                      id
-                    }}
-                  }}
-                  size: fieldValueByName(name: "Size") {{
-                    ... on ProjectV2ItemFieldSingleSelectValue {{
-                      id: optionId
-                      name
-                    }}
-                  }}
                   content {{
                     ... on Issue {{
-                      id
-                      title
-                      number
                       state
-                      url
-                      assignees(first:20) {{
-                        nodes {{
-                          name
-                          email
-                          login
-                        }}
-                      }}
                     }}
                   }}
                 }}
                 pageInfo {{
                 endCursor
                 hasNextPage
-                hasPreviousPage
               }}
-              totalCount
               }}
             }}
           }}
         }}
     """
 
+    fields_query = f"""
+    query GetProjectItems($ids: [ID!]!, {ITEM_FIELD_DECLARATIONS}) {{
+        nodes(ids: $ids) {{
+            ...ProjectItemFields
+        }}
+    }}
+    """ + PROJECT_ITEM_FRAGMENT
+
     variables = {
         'owner': owner,
         'projectNumber': project_number,
         'after': after
     }
 
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": query, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
-    )
+    while True:
+        with _reading(f"the items after cursor {variables['after']}"):
+            response = client.post(states_query, variables, function='_iter_item_pages_by_state')
+            data = response.json()
+        stats['bytes'] += len(response.content)
 
-    if response.json().get('errors'):
-        logger.info(response.json().get('errors'))
+        if data.get('errors'):
+            logger.info(data.get('errors'))
 
-    if issues is None:
-        issues = []
+        items = _owner_project(data, owner_type, f"the items after cursor {variables['after']}").get('items')
+        ids = [node['id'] for node in items.get('nodes') if _keep_item(node, filters)]
+        stats['downloaded'] += len(items.get('nodes'))
 
-    nodes = response.json().get('data').get(owner_type).get('projectV2').get('items').get('nodes')
+        page = []
+        if ids:
+            with _reading(f'the fields of {len(ids)} items'):
+                response = client.post(fields_query, {'ids': ids, **_item_field_variables()}, function='_iter_item_pages_by_state')
+                fields = response.json()
+            stats['bytes'] += len(response.content)
 
-    if filters:
-        filtered_issues = []
-        for node in nodes:
-            if filters.get('open_only') and node['content'].get('state') != 'OPEN':
-                continue
+            if fields.get('errors'):
+                logger.info(fields.get('errors'))
+            if not fields.get('data'):
+                raise ProjectReadError(f"Could not read the fields of {len(ids)} items: {fields.get('errors')}")
 
-            filtered_issues.append(node)
+            page = [ProjectItem.from_node(node) for node in fields['data'].get('nodes') if node]
+            del fields
+        stats['kept'] += len(page)
+        pageinfo = items.get('pageInfo')
+        del data, items, response
 
-        nodes = filtered_issues
+        yield page, pageinfo.get('endCursor')
 
-    issues = issues + nodes
+        if not pageinfo.get('hasNextPage'):
+            break
 
-    pageinfo = response.json().get('data').get(owner_type).get('projectV2').get('items').get('pageInfo')
-    if pageinfo.get('hasNextPage'):
-        return get_project_issues(
-            owner=owner,
-            owner_type=owner_type,
-            project_number=project_number,
-            after=pageinfo.get('endCursor'),
-            filters=filters,
-            issues=issues,
-        )
+        variables['after'] = pageinfo.get('endCursor')
+
+
+def get_project_item(item_id):
+    """
+    Return a single project item as a ProjectItem, or None if it cannot be found
+    """
+    query = f"""
+    query GetProjectItem($id: ID!, {ITEM_FIELD_DECLARATIONS}) {{
+        node(id: $id) {{
+            ...ProjectItemFields
+        }}
+    }}
+    """ + PROJECT_ITEM_FRAGMENT
+
+    with _reading(f'the item {item_id}'):
+        data = client.post(query, {'id': item_id, **_item_field_variables()}, function='get_project_item').json()
+    if data.get('errors'):
+        logger.info(data.get('errors'))
+
+    node = (data.get('data') or {}).get('node')
+    return ProjectItem.from_node(node) if node else None
+
+
+def get_issue_project_item(issue_id, project_id):
+    """
+    Return the item of an issue in the given project as a ProjectItem, or None if the issue is not in it
+    """
+    query = f"""
+    query GetIssueProjectItems($id: ID!, {ITEM_FIELD_DECLARATIONS}) {{
+        node(id: $id) {{
+            ... on Issue {{
+                projectItems(first: 50) {{
+                    nodes {{
+                        project {{
+                            id
+                        }}
+                        ...ProjectItemFields
+                    }}
+                }}
+            }}
+        }}
+    }}
+    """ + PROJECT_ITEM_FRAGMENT
+
+    with _reading(f'the project items of the issue {issue_id}'):
+        data = client.post(query, {'id': issue_id, **_item_field_variables()}, function='get_issue_project_item').json()
+    if data.get('errors'):
+        logger.info(data.get('errors'))
+
+    node = (data.get('data') or {}).get('node') or {}
+    for item in (node.get('projectItems') or {}).get('nodes', []):
+        if item and (item.get('project') or {}).get('id') == project_id:
+            return ProjectItem.from_node(item)
+
+    return None
 
-    return issues
 
 def get_issue(owner_name, repo_name, issue_number):
     # GraphQL query
     query = """
-    query($owner: String!, $repo: String!, $issueNumber: Int!) {
+    query GetIssue($owner: String!, $repo: String!, $issueNumber: Int!) {
         repository(owner: $owner, name: $repo) {
             issue(number: $issueNumber) {
                 id
@@ -208,18 +573,19 @@ def get_issue(owner_name, repo_name, issue_number):
         'issueNumber': issue_number
     }
 
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": query, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
-    )
+    with _reading(f'the issue {owner_name}/{repo_name}#{issue_number}'):
+        data = client.post(query, variables, function='get_issue').json()
+    if not data.get('data'):
+        raise ProjectReadError(f"Could not read the issue {owner_name}/{repo_name}#{issue_number}: {data.get('errors')}")
 
     # Parse and return the issue details
-    data = response.json()
-    return data.get('data', {}).get('repository', {}).get('issue', None)
+    return (data['data'].get('repository') or {}).get('issue')
 
 
 def add_issue_comment(issueId, comment):
+    """
+    Add a comment to an issue, raising TransientError without retrying when the request failed in a way that may pass
+    """
     mutation = """
     mutation AddIssueComment($issueId: ID!, $comment: String!) {
         addComment(input: {subjectId: $issueId, body: $comment}) {
@@ -232,19 +598,51 @@ def add_issue_comment(issueId, comment):
         'issueId': issueId,
         'comment': comment
     }
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": mutation, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
-    )
+    # The comments of an issue keep the same author when several tokens are given
+    response = client.post(mutation, variables, affinity=issueId, function='add_issue_comment')
+    if is_transient(response):
+        raise TransientError(f'HTTP {response.status_code} while adding a comment', response=response)
     if response.json().get('errors'):
         logger.info(response.json().get('errors'))
 
     return response.json().get('data')
 
 
+def update_issue_comment(commentId, comment, author_login=None):
+    mutation = """
+    mutation UpdateIssueComment($commentId: ID!, $comment: String!) {
+        updateIssueComment(input: {id: $commentId, body: $comment}) {
+            issueComment {
+                id
+            }
+        }
+    }
+    """
+
+    variables = {
+        'commentId': commentId,
+        'comment': comment
+    }
+    # Only the author of a comment can edit it
+    try:
+        data = client.post(
+            mutation, variables, token=client.tokens.for_login(author_login), idempotent=True, function='update_issue_comment'
+        ).json()
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Failed to update comment {commentId}: {e}")
+        return None
+    if data.get('errors'):
+        logger.info(data.get('errors'))
+
+    return data.get('data')
+
 
 def get_issue_comments(issueId):
+    """
+    Return all the comments of an issue
+
+    :raise requests.RequestException: When any page of the comments could not be read
+    """
     query = """
     query GetIssueComments($issueId: ID!, $afterCursor: String) {
         node(id: $issueId) {
@@ -274,36 +672,178 @@ def get_issue_comments(issueId):
 
     all_comments = []
 
+    while True:
+        try:
+            data = client.post(query, variables, function='get_issue_comments').json()
+        except ValueError as e:
+            raise TransientError(f'Could not read the comments of {issueId}: {e}') from e
+
+        # A partial thread could miss the comment looked for
+        if data.get('errors') or not data.get('data'):
+            raise TransientError(f"Could not read the comments of {issueId}: {data.get('errors')}")
+
+        comments_data = (data['data'].get('node') or {}).get('comments') or {}
+        comments = comments_data.get('nodes', [])
+        all_comments.extend(comments)
+
+        pageinfo = comments_data.get('pageInfo', {})
+        if not pageinfo.get('hasNextPage'):
+            break
+
+        # Set the cursor for the next page
+        variables['afterCursor'] = pageinfo.get('endCursor')
+
+    return all_comments
+
+
+def _get_viewer_login(token=None):
+    query = """
+    query GetViewer {
+        viewer {
+            login
+        }
+    }
+    """
+
     try:
-        while True:
-            response = requests.post(
-                config.api_endpoint,
-                json={"query": query, "variables": variables},
-                headers={"Authorization": f"Bearer {config.gh_token}"}
-            )
+        data = client.post(query, token=token, function='_get_viewer_login').json()
+    except (requests.RequestException, ValueError) as e:
+        data = {'errors': [{'message': str(e)}]}
+    if data.get('errors') or not data.get('data'):
+        logger.info(f"Could not resolve the viewer login: {data.get('errors')}")
+        return None
 
-            data = response.json()
+    return data['data']['viewer']['login']
 
-            if 'errors' in data:
-                logging.error(f"GraphQL query errors: {data['errors']}")
-                break
 
-            comments_data = data.get('data', {}).get('node', {}).get('comments', {})
-            comments = comments_data.get('nodes', [])
-            all_comments.extend(comments)
+@functools.lru_cache(maxsize=None)
+def get_viewer_logins():
+    """
+    Return the logins of the accounts of all the tokens, as the comments of the action
+    may have been written by any of them
+    """
+    for token in client.tokens.tokens:
+        token.login = _get_viewer_login(token)
 
-            pageinfo = comments_data.get('pageInfo', {})
-            if not pageinfo.get('hasNextPage'):
-                break
+    return tuple(dict.fromkeys(token.login for token in client.tokens.tokens if token.login))
 
-            # Set the cursor for the next page
-            variables['afterCursor'] = pageinfo.get('endCursor')
 
-        return all_comments
+def get_latest_matching_comments(issue_ids, contains, author_login=None, page_size=20, batch_size=COMMENT_LOOKUP_BATCH_SIZE):
+    """
+    Find the newest comment of many issues that contains the given text, or any of the given
+    texts, optionally restricted to the comments written by the given author, or any of the given authors.
+
+    :return: A dictionary from issue ID to the body of the matching comment, or None if there is none.
+             Issues whose comments could not be read are left out.
+    """
+    found = find_latest_matching_comments(issue_ids, contains, author_login, page_size, batch_size)
+    return {issue_id: comment['body'] if comment else None for issue_id, comment in found.items()}
+
+
+def get_latest_matching_comment(issue_id, contains, author_login=None):
+    """
+    Find the newest comment of an issue that contains the given text
+
+    :return: The matching comment as a dictionary with its id and body, or None if there is none
+             or the comments could not be read
+    """
+    return find_latest_matching_comments([issue_id], contains, author_login).get(issue_id)
+
+
+def find_latest_matching_comments(issue_ids, contains, author_login=None, page_size=20, batch_size=COMMENT_LOOKUP_BATCH_SIZE):
+    """
+    Same as get_latest_matching_comments, returning the matching comments with their id, body and author.
+
+    The comments are read from the newest to the oldest with one aliased query per batch
+    of issues, and the paging of an issue stops as soon as a matching comment is found.
+    """
+    texts = (contains,) if isinstance(contains, str) else tuple(contains)
+    authors = (author_login,) if isinstance(author_login, str) else tuple(author_login or ())
+    found = {issue_id: None for issue_id in issue_ids}
+
+    # Every pending issue keeps the cursor of the oldest comment read so far
+    pending = {issue_id: None for issue_id in found}
+
+    while pending:
+        batch = list(pending.items())[:batch_size]
+
+        declarations = ['$last: Int!']
+        selections = []
+        variables = {'last': page_size}
+        for index, (issue_id, before) in enumerate(batch):
+            declarations += [f'$id{index}: ID!', f'$before{index}: String']
+            selections.append(f"""
+            i{index}: node(id: $id{index}) {{
+                ... on Issue {{
+                    comments(last: $last, before: $before{index}) {{
+                        nodes {{
+                            id
+                            body
+                            author {{
+                                login
+                            }}
+                        }}
+                        pageInfo {{
+                            startCursor
+                            hasPreviousPage
+                        }}
+                    }}
+                }}
+            }}""")
+            variables[f'id{index}'] = issue_id
+            variables[f'before{index}'] = before
+
+        query = f"""
+        query GetRecentIssueComments({', '.join(declarations)}) {{
+            rateLimit {{
+                cost
+                remaining
+                resetAt
+            }}
+            {''.join(selections)}
+        }}
+        """
+
+        try:
+            data = client.post(query, variables, function='find_latest_matching_comments').json()
+        except (requests.RequestException, ValueError) as e:
+            data = {'errors': [{'message': str(e)}]}
+
+        if data.get('errors'):
+            logger.error(f"GraphQL query errors: {data['errors']}")
+
+        if not data.get('data'):
+            # Leave the issues of the failed batch out of the result, as their comments are unknown
+            for issue_id, _ in batch:
+                del pending[issue_id]
+                del found[issue_id]
+            continue
+
+        for index, (issue_id, _) in enumerate(batch):
+            node = data['data'].get(f'i{index}') or {}
+            comments_data = node.get('comments')
+            if not comments_data:
+                del pending[issue_id]
+                continue
+
+            # The page is in chronological order, so walk it backwards
+            for comment in reversed(comments_data.get('nodes', [])):
+                author = (comment.get('author') or {}).get('login')
+                if authors and author not in authors:
+                    continue
+                body = comment.get('body', '')
+                if any(text in body for text in texts):
+                    found[issue_id] = comment
+                    break
+
+            pageinfo = comments_data.get('pageInfo', {})
+            if found[issue_id] is not None or not pageinfo.get('hasPreviousPage'):
+                del pending[issue_id]
+            else:
+                pending[issue_id] = pageinfo.get('startCursor')
+
+    return found
 
-    except requests.RequestException as e:
-        logging.error(f"Request error: {e}")
-        return []
 
 def update_project_item_fields(project_id, item_id, updates):
     """
@@ -316,48 +856,105 @@ def update_project_item_fields(project_id, item_id, updates):
                     - type: Type of the field ('single_select' or 'iteration')
                     - value: The new value (singleSelectOptionId for single_select, iterationId for iteration)
     """
-    mutation = """
-    mutation UpdateProjectV2ItemFieldValue($input: UpdateProjectV2ItemFieldValueInput!) {
-      updateProjectV2ItemFieldValue(input: $input) {
-        projectV2Item {
-          id
-        }
-      }
-    }
+    return update_project_items_fields(
+        project_id=project_id,
+        items=[{'item_id': item_id, 'updates': updates}]
+    )
+
+
+def update_project_items_fields(project_id, items, batch_size=None):
     """
+    Updates the fields of many project items, packing the field updates of several
+    items as aliased mutations into a single GraphQL document.
 
-    headers = {
-        "Authorization": f"Bearer {config.gh_token}",  # Replace with your GitHub token
-        "Content-Type": "application/json"
-    }
+    :param project_id: The ID of the project.
+    :param items: A list of dictionaries with:
+                  - item_id: ID of the item to update
+                  - updates: A list of updates as described in update_project_item_fields
+    :param batch_size: The maximum number of field updates sent in one document.
+    :return: A list of errors, where each error is a dictionary with item_id, field_id and message
+    """
+    batch_size = min(batch_size or config.mutation_batch_size, MAX_MUTATION_BATCH_SIZE)
+
+    # Flatten the updates so that each one gets its own alias
+    inputs = []
+    for item in items:
+        for update in item['updates']:
+            value = _field_value_input(update)
+            if value is None:
+                logger.info(f"Unsupported field type: {update['type']}")
+                continue
 
-    for update in updates:
-        input_value = {
-            "projectId": project_id,
-            "itemId": item_id,
-            "fieldId": update["field_id"],
-            "value": {}
-        }
+            inputs.append({
+                "projectId": project_id,
+                "itemId": item['item_id'],
+                "fieldId": update["field_id"],
+                "value": value
+            })
 
-        if update["type"] == "single_select":
-            input_value["value"]["singleSelectOptionId"] = update["value"]
-        elif update["type"] == "iteration":
-            input_value["value"]["iterationId"] = update["value"]
-        else:
-            logger.info(f"Unsupported field type: {update['type']}")
-            continue
+    errors = []
+    for start in range(0, len(inputs), batch_size):
+        errors += _send_field_updates(inputs[start:start + batch_size])
+
+    return errors
+
+
+def _field_value_input(update):
+    if update["type"] == "single_select":
+        return {"singleSelectOptionId": update["value"]}
+    elif update["type"] == "iteration":
+        return {"iterationId": update["value"]}
 
-        variables = {"input": input_value}
+    return None
 
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": mutation, "variables": variables},
-            headers=headers
-        )
 
-        if response.status_code == 200:
-            response_data = response.json()
-            if response_data.get("errors"):
-                logger.info("Errors:", response_data["errors"])
-        else:
-            logger.info(f"HTTP error {response.status_code}: {response.text}")
+def _send_field_updates(inputs):
+    """
+    Send one aliased mutation document and map every error back to the update that caused it
+    """
+    aliases = {f'u{index}': input_value for index, input_value in enumerate(inputs)}
+
+    declarations = ', '.join(f'${alias}: UpdateProjectV2ItemFieldValueInput!' for alias in aliases)
+    selections = '\n'.join(
+        f'{alias}: updateProjectV2ItemFieldValue(input: ${alias}) {{ projectV2Item {{ id }} }}'
+        for alias in aliases
+    )
+    mutation = f"""
+    mutation BulkUpdateProjectV2ItemFieldValues({declarations}) {{
+      {selections}
+    }}
+    """
+
+    # Setting a field to the same value twice is harmless, so the document is retried on failures
+    try:
+        response = client.post(mutation, aliases, idempotent=True, function='_send_field_updates')
+    except requests.RequestException as e:
+        logger.info(f"Request error: {e}")
+        return [
+            {'item_id': input_value['itemId'], 'field_id': input_value['fieldId'], 'message': str(e)}
+            for input_value in aliases.values()
+        ]
+
+    if response.status_code != 200:
+        logger.info(f"HTTP error {response.status_code}: {response.text}")
+        return [
+            {'item_id': input_value['itemId'], 'field_id': input_value['fieldId'], 'message': f'HTTP {response.status_code}'}
+            for input_value in aliases.values()
+        ]
+
+    errors = []
+    for error in response.json().get('errors') or []:
+        path = error.get('path') or []
+        value = aliases.get(path[0]) if path else None
+        if value is None:
+            # The error is not tied to an alias, so the whole document failed
+            logger.info(f"Errors: {error}")
+            return [
+                {'item_id': input_value['itemId'], 'field_id': input_value['fieldId'], 'message': error.get('message')}
+                for input_value in aliases.values()
+            ]
+
+        logger.info(f"Failed to update field {value['fieldId']} of item {value['itemId']}: {error.get('message')}")
+        errors.append({'item_id': value['itemId'], 'field_id': value['fieldId'], 'message': error.get('message')})
+
+    return errors
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+import cache
+import config
+import graphql
+import utils
+from logger import logger
+from metrics import run_metrics
+
+# Records buffered before they are written out, between two checkpoints
+FLUSH_RECORDS = 200
+
+
+def update_key(item_id, update):
+    return f"{item_id}:{update['field_id']}:{update['value']}"
+
+
+def comment_key(target, comment):
+    return hashlib.sha1(f'{target}\n{comment}'.encode()).hexdigest()[:20]
+
+
+class Journal:
+    """
+    Append-only JSONL journal of a sweep, so that a run that dies partway through can be
+    resumed by the next one. It records the cursor after every page that was fully
+    processed, every field update and comment that was applied, and every comment whose
+    request failed, which the next run replays.
+
+    The records are buffered and written in batches, and the file is only fsync'd at the
+    checkpoints, once per page. A record lost in a crash means at most that the next run
+    redoes an idempotent field update, or reads the comments of the item again.
+    """
+
+    def __init__(self, owner, project_number, project, today):
+        self.path = os.path.join(config.cache_dir, f'journal-{owner}-{project_number}{cache.shard_suffix()}.jsonl')
+        # The journal of a run interrupted on another day, or before the project fields changed, is stale
+        self.context = {
+            'day': today.isoformat(),
+            'schema': graphql.fields_version(project),
+            'incremental': config.incremental
+        }
+        self.lock = threading.Lock()
+        self.buffer = []
+
+        self.cursor = None
+        self.updates = set()
+        self.comments = set()
+        self.failed_comments = {}
+        self.markers = []
+        self.digest_items = []
+        self.digested = 0
+        self.failed = False
+        self.started_at = None
+
+        records = self._read()
+        if records and records[0].get('context') == self.context:
+            self._replay(records)
+        elif records:
+            logger.info('Journal: the interrupted run is stale, starting over')
+
+        self.resumed = self.started_at is not None
+        if self.resumed:
+            logger.info(
+                f'Journal: resuming the run started at {self.started_at} after cursor {self.cursor} | '
+                f'{len(self.updates)} field updates and {len(self.comments)} comments already applied'
+            )
+        else:
+            self.started_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, 'a' if self.resumed else 'w')
+        if not self.resumed:
+            self._append({'type': 'start', 'started_at': self.started_at, 'context': self.context})
+            self.flush(sync=True)
+
+    def _read(self):
+        records = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # The last line may be cut short by the crash
+                        break
+        except OSError:
+            pass
+
+        return records
+
+    def _replay(self, records):
+        for record in records:
+            kind = record.get('type')
+            if kind == 'start':
+                self.started_at = record.get('started_at')
+            elif kind == 'cursor':
+                self.cursor = record.get('after')
+            elif kind == 'update':
+                self.updates.add(record['key'])
+            elif kind == 'comment':
+                self.comments.add(record['key'])
+                if record.get('markers'):
+                    self.markers.append(record['markers'])
+            elif kind == 'failed_comment':
+                self.failed_comments[record['key']] = (record['target'], record['comment'])
+            elif kind == 'digest':
+                self.digest_items.extend(record['items'])
+
+    def _append(self, record):
+        self.buffer.append(json.dumps(record, separators=(',', ':')))
+
+    def flush(self, sync=False):
+        with self.lock:
+            if self.buffer:
+                self.file.write('\n'.join(self.buffer) + '\n')
+                self.buffer = []
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def applied_update(self, item_id, update):
+        return update_key(item_id, update) in self.updates
+
+    def applied_comment(self, target, comment):
+        return comment_key(target, comment) in self.comments
+
+    def record_updates(self, item_id, updates):
+        with self.lock:
+            for update in updates:
+                key = update_key(item_id, update)
+                self.updates.add(key)
+                self._append({'type': 'update', 'key': key})
+        self._flush_if_full()
+
+    def record_comment(self, target, comment):
+        key = comment_key(target, comment)
+        record = {'type': 'comment', 'key': key}
+        # The markers of the comment go to the marker index of the run that completes
+        markers = ''.join(match.group(0) for match in utils.COMMENT_MARKER_PATTERN.finditer(comment))
+        if markers:
+            record['markers'] = markers
+        with self.lock:
+            self.comments.add(key)
+            self._append(record)
+        self._flush_if_full()
+
+    def record_failed_comment(self, target, comment):
+        """
+        Record a comment whose request failed. Its fields may be updated already, so the
+        next run would not write it again, it replays it instead.
+        """
+        key = comment_key(target, comment)
+        with self.lock:
+            self.failed_comments[key] = (target, comment)
+            self._append({'type': 'failed_comment', 'key': key, 'target': target, 'comment': comment})
+        self.record_failure()
+
+    def record_failure(self):
+        """
+        Record that a write failed. The checkpoint then stays before the page of the
+        failure, so that the next run retries its writes.
+        """
+        if not self.failed:
+            logger.info(f'Journal: a write failed, the checkpoint stays after cursor {self.cursor}')
+        self.failed = True
+
+    def _flush_if_full(self):
+        if len(self.buffer) >= FLUSH_RECORDS:
+            self.flush()
+
+    def checkpoint(self, cursor, digest=None):
+        """
+        Record durably that every page up to the cursor is processed, along with the
+        items the digest collected from them
+        """
+        with self.lock:
+            if digest and len(digest.items) > self.digested:
+                self._append({'type': 'digest', 'items': digest.items[self.digested:]})
+                self.digested = len(digest.items)
+            if cursor and not self.failed:
+                self.cursor = cursor
+                self._append({'type': 'cursor', 'after': cursor})
+        self.flush(sync=True)
+
+    def restore(self, digest=None, markers=None):
+        """
+        Give back the digest items and the comment markers of the interrupted run
+        """
+        if digest and self.digest_items:
+            digest.merge(self.digest_items)
+            self.digested = len(digest.items)
+        if markers:
+            for comment_markers in self.markers:
+                markers.record(comment_markers)
+
+    def replay_comments(self, markers=None):
+        """
+        Add the comments whose request failed in the interrupted run. A failed request may
+        still have added its comment, so a comment is only sent again once the lookup of its
+        markers shows that it is not on the issue.
+        """
+        pending = [(key, target, comment) for key, (target, comment) in self.failed_comments.items() if key not in self.comments]
+        if not pending:
+            return
+
+        replayed = 0
+        for key, target, comment in pending:
+            try:
+                exists = utils.check_comment_exists(target, comment)
+            except requests.RequestException as e:
+                logger.error(f'Journal: could not check whether the comment to {target} was added: {e}')
+                self.record_failure()
+                continue
+
+            if not exists:
+                if not utils.post_comment(target, comment):
+                    self.record_failure()
+                    continue
+                replayed += 1
+                run_metrics.count('comments')
+
+            self.record_comment(target, comment)
+            if markers:
+                markers.record(comment)
+
+        logger.info(f'Journal: {replayed} of the {len(pending)} failed comments of the interrupted run replayed')
+
+    def finish(self):
+        """
+        The run went through, the next one starts over, unless some of its writes failed:
+        the next run then resumes from the last checkpoint before the failure to retry them
+        """
+        logger.info(f'Journal: {len(self.updates)} field updates and {len(self.comments)} comments applied')
+        if self.failed:
+            logger.info(f'Journal: some writes failed, the next run retries them after cursor {self.cursor}')
+            return
+
+        os.remove(self.path)
+
+    def close(self):
+        """
+        Keep the journal for the next run to resume from the last checkpoint
+        """
+        self.flush(sync=True)
+        self.file.close()
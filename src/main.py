@@ -1,105 +1,101 @@
+import asyncio
+import sys
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from logger import logger
 from datetime import datetime, timedelta
+import cache
 import config
+import events
+import shards
 import utils
 import graphql
-
-def notify_due_date_changes(issues):
+from digest import CommentDigest
+from journal import Journal
+from metrics import merge_summaries, run_metrics, write_report
+from plan import MutationPlan, plan_path
+from projects import project_targets
+from schema import ProjectSchema
+
+def due_date_candidates(issues):
+    """
+    Return the (issue, due date) pairs of the items that have a due date
+    """
+    candidates = []
     for projectItem in issues:
-        # Safely extract 'content' from projectItem
-        issue = projectItem.get('content')
+        issue = projectItem.issue
         if not issue:
             logger.error(f"Missing 'content' in project item: {projectItem}")
             continue
 
-        # Get the list of assignees
-        assignees = issue.get('assignees', {}).get('nodes', [])
-        
-        # Get the due date value
-        due_date = None
-        due_date_obj = None
-        try:
-            due_date = projectItem.get('dueDate').get('date')
-            if due_date:
-                due_date_obj = datetime.strptime(due_date, "%Y-%m-%d").date()
-        except (AttributeError, ValueError) as e:
-            continue  # Skip this issue and move to the next
+        # Skip the items without a valid due date
+        if not projectItem.due_date:
+            continue
 
-        issue_title = issue.get('title', 'Unknown Title')
-        issueId = issue.get('id', 'Unknown ID')
+        candidates.append((issue, projectItem.due_date))
 
-        if not due_date_obj:
-            logger.info(f'No due date found for issue {issue_title}')
-            continue
-        
-        expected_comment = f"The Due Date is updated to: {due_date_obj.strftime('%b %d, %Y')}."
-      
-        # Check if the comment already exists
-        if not utils.check_comment_exists(issueId, expected_comment):
-            # Prepare the notification content
-                
-            comment = utils.prepare_duedate_comment(
-                issue=issue,
-                assignees=assignees, 
-                due_date=due_date_obj
-            )
-                
-            if not config.dry_run:
-                try:
-                    # Add the comment to the issue
-                    graphql.add_issue_comment(issueId, comment)
-                    logger.info(f'Comment added to issue with title {issue_title}. Due date is {due_date_obj}.')
-                except Exception as e:
-                    logger.error(f"Failed to add comment to issue {issue_title} (ID: {issueId}): {e}")
-            else:
-                logger.info(f'DRY RUN: Comment prepared for issue with title {issue_title}. Due date is {due_date_obj}.')
+    return candidates
 
 
-def fields_based_on_due_date(project, issue, updates):
-    # Extract all field nodes from the project
-    field_nodes = project["fields"]["nodes"]
+def prepare_due_date_notification(issue, due_date_obj, latest_comments):
+    """
+    Return the due date comment of the issue, or None if the latest one already announces the due date
+    """
+    if issue.id not in latest_comments:
+        logger.error(f"Could not read the comments of issue {issue.title} (ID: {issue.id}), skipping it")
+        return None
 
-    # Identify the 'Release' and 'Week' fields by name
-    release_field = next((field for field in field_nodes if field and field["name"] == "Release"), None)
-    week_field = next((field for field in field_nodes if field and field["name"] == "Week"), None)
+    # Check if the latest due date comment already announces this due date, by its marker
+    # or by its text for the comments written before the markers
+    legacy_comment = f"{utils.DUEDATE_COMMENT_PREFIX} {due_date_obj.strftime('%b %d, %Y')}."
+    if utils.comment_announces(latest_comments[issue.id], due_date_marker(issue, due_date_obj), legacy_comment):
+        return None
+
+    # Prepare the notification content
+    return utils.prepare_duedate_comment(
+        issue=issue,
+        assignees=issue.assignees,
+        due_date=due_date_obj
+    )
 
-    # Get the options for 'Release' and 'Week' fields
-    release_options = release_field['options']
-    week_options = week_field['configuration']['iterations'] + week_field['configuration']['completedIterations']
 
+def due_date_marker(issue, due_date_obj):
+    return utils.comment_marker(utils.DUEDATE_MARKER_FIELD, issue.id, due_date_obj.isoformat())
+
+
+def fields_based_on_due_date(schema, issue, updates):
     comment_fields = []
 
     # Skip processing if the issue does not have a due date
-    if not issue.get('dueDate'):
+    if not issue.due_date:
         return comment_fields
 
-    # Retrieve the due date from the issue
-    due_date = issue.get('dueDate').get('date')
-    output = due_date
+    output = issue.due_date.isoformat()
+
+    # Find the week and the release of the due date
+    week, release = schema.resolve_due_date(issue.due_date)
 
     # Handle missing 'week' field by finding the appropriate week based on the due date
-    week = utils.find_week(weeks=week_options, date_str=due_date)
-    if week and week != issue.get('week'):
+    if week and week['id'] != issue.week_id:
         # Add the 'week' field update to the updates list
         updates.append({
-            "field_id": week_field['id'],
+            "field_id": schema.week_field['id'],
             "type": "iteration",
             "value": week['id']
         })
         output += f' -> Week {week}'
-        comment_fields.append({'field': 'Week', 'value': week['title']})
+        comment_fields.append({'field': config.week_field_name, 'value': week['title']})
 
     # Handle missing 'release' field by finding the appropriate release based on the due date
-    release = utils.find_release(releases=release_options, date_str=due_date)
-    if release and release != issue.get('release'):
+    if release and release['id'] != issue.release_id:
         # Add the 'release' field update to the updates list
         updates.append({
-            "field_id": release_field['id'],
+            "field_id": schema.release_field['id'],
             "type": "single_select",
             "value": release['id']
         })
         output += f' -> Release {release}'
-        comment_fields.append({'field': 'Release', 'value': release['name']})
+        comment_fields.append({'field': config.release_field_name, 'value': release['name']})
 
     # Log the updates for debugging or tracking purposes
     logger.debug(output)
@@ -107,86 +103,793 @@ def fields_based_on_due_date(project, issue, updates):
     return comment_fields
 
 
-def fields_based_on_estimation(project, issue, updates):
-    # Extract all field nodes from the project
-    field_nodes = project["fields"]["nodes"]
-
-    # Identify the 'Size' field by name
-    size_field = next((field for field in field_nodes if field and field["name"] == "Size"), None)
-    size_options = size_field['options']
-
+def fields_based_on_estimation(schema, issue, updates):
     comment_fields = []
 
     # Skip processing if the issue does not have an estimate
-    if not issue.get('estimate'):
+    if not issue.estimate:
         return comment_fields
 
-    # Retrieve the estimate value from the issue
-    estimate = issue.get('estimate').get('name')
-    output = estimate
+    output = issue.estimate
 
     # Find the size corresponding to the estimate and update if found
-    size = utils.find_size(sizes=size_options, estimate_name=estimate)
-    if size and size != issue.get('size'):
+    size = schema.resolve_estimate(issue.estimate)
+    if size and size['id'] != issue.size_id:
         # Add the 'size' field update to the updates list
         updates.append({
-            "field_id": size_field['id'],
+            "field_id": schema.size_field['id'],
             "type": "single_select",
             "value": size['id']
         })
         # Log the update for debugging or tracking purposes
         logger.debug(f'{output} -> Size {size}')
-        comment_fields.append({'field': 'Size', 'value': size['name']})
+        comment_fields.append({'field': config.size_field_name, 'value': size['name']})
 
     return comment_fields
 
 
-def update_fields(issues):
-    # Fetch the project details from GraphQL
-    project = graphql.get_project(
-        organization_name=config.repository_owner,
-        project_number=config.project_number
+def get_comments_issue():
+    """
+    Return the issue that collects the comments, if one is configured
+    """
+    if not config.comments_issue_repo:
+        return None
+
+    return graphql.get_issue(
+        owner_name=config.repository_owner,
+        repo_name=config.comments_issue_repo,
+        issue_number=config.comments_issue_number
     )
 
-    comments_issue = None
-    if config.comments_issue_repo:
-        comments_issue = graphql.get_issue(
-            owner_name=config.repository_owner,
-            repo_name=config.comments_issue_repo,
-            issue_number=config.comments_issue_number
-        )
-    
 
-    # Iterate over all issues to check and set missing fields
-    for issue in issues:
-        updates = []
-        # Determine missing fields based on estimation and due date
-        comment_fields = fields_based_on_estimation(project, issue, updates)
-        comment_fields += fields_based_on_due_date(project, issue, updates)
+def prepare_field_updates(schema, issue):
+    """
+    Resolve the missing fields of the item and the comment that summarizes them
+    """
+    if not issue.issue:
+        return None
+
+    updates = []
+    # Determine missing fields based on estimation and due date
+    comment_fields = fields_based_on_estimation(schema, issue, updates)
+    comment_fields += fields_based_on_due_date(schema, issue, updates)
+
+    if not updates:
+        return None
+
+    comment = utils.prepare_fields_comment(issue.issue, comment_fields)
+
+    return {'item': issue, 'updates': updates, 'comment': comment, 'fields': comment_fields}
+
+
+# The due date comments of the action carry a due date marker, the older ones only the prefix
+DUEDATE_COMMENT_MATCH = (f'{utils.COMMENT_MARKER}{utils.DUEDATE_MARKER_FIELD} ', utils.DUEDATE_COMMENT_PREFIX)
+
+
+def indexed_due_date_comments(candidates, markers=None):
+    """
+    Return the markers of the candidates whose due date the marker index records as announced,
+    as their latest due date comment, so that their comments are not read
+    """
+    if not markers:
+        return {}
+
+    known = {}
+    for issue, due_date_obj in candidates:
+        marker = due_date_marker(issue, due_date_obj)
+        if markers.announced(marker):
+            known[issue.id] = marker
+
+    return known
+
+
+def index_announced_due_dates(candidates, latest_comments, markers=None):
+    """
+    Record in the marker index the due dates that the comments read already announce,
+    including the ones announced by comments written before the markers
+    """
+    if not markers:
+        return
+
+    for issue, due_date_obj in candidates:
+        legacy_comment = f"{utils.DUEDATE_COMMENT_PREFIX} {due_date_obj.strftime('%b %d, %Y')}."
+        marker = due_date_marker(issue, due_date_obj)
+        if utils.comment_announces(latest_comments.get(issue.id), marker, legacy_comment):
+            markers.record(marker)
+
+
+def lookup_due_date_comments(candidates, markers=None):
+    """
+    Look up the latest due date comment of all the candidate issues at once
+    """
+    latest_comments = indexed_due_date_comments(candidates, markers)
+    candidates = [(issue, due_date_obj) for issue, due_date_obj in candidates if issue.id not in latest_comments]
+    if not candidates:
+        return latest_comments
+
+    latest_comments.update(graphql.get_latest_matching_comments(
+        issue_ids=[issue.id for issue, _ in candidates],
+        contains=DUEDATE_COMMENT_MATCH,
+        author_login=graphql.get_viewer_logins()
+    ))
+    index_announced_due_dates(candidates, latest_comments, markers)
+
+    return latest_comments
+
+
+def unread_items(issues, candidates, latest_comments):
+    """
+    Return the IDs of the items whose due date comments could not be read, as their notices are undecided
+    """
+    unread = {issue.id for issue, _ in candidates if issue.id not in latest_comments}
+    return {item.id for item in issues if item.issue and item.issue.id in unread}
+
+
+def plan_item_writes(issues, candidates, schema, latest_comments):
+    """
+    Compute every write of the items in a single pass: the field updates of an item,
+    the summary of the updated fields and the due date notice it needs, if any.
+    Items without anything to write are left out.
+    """
+    notices = {}
+    for issue, due_date_obj in candidates:
+        notice = prepare_due_date_notification(issue, due_date_obj, latest_comments)
+        if notice:
+            notices[issue.id] = (due_date_obj, notice)
+
+    pending = []
+    for projectItem in issues:
+        # Only the items of issues get comments, the other items are reported by due_date_candidates
+        if not projectItem.issue:
+            continue
+
+        entry = prepare_field_updates(schema, projectItem) or {'item': projectItem, 'updates': [], 'comment': None, 'fields': []}
+        entry['due_date'], entry['notice'] = notices.get(projectItem.issue.id, (None, None))
+
+        if entry['updates'] or entry['notice']:
+            pending.append(entry)
+
+    return pending
+
+
+def log_planned_writes(pending, comments_issue, digest=None):
+    """
+    Log the writes of the pending items instead of sending them, in dry run mode
+    """
+    for entry in pending:
+        url = entry['item'].issue.url
+        for target, comment in item_comments(entry, comments_issue, digest=digest):
+            logger.info(f"DRY RUN: Comment prepared for {url} on {target} with comment {comment}")
+
+
+def batch_field_updates(pending):
+    """
+    Split the pending items into batches of about mutation_batch_size field updates
+    """
+    batch = []
+    batch_updates = 0
+    for entry in pending:
+        batch.append(entry)
+        batch_updates += len(entry['updates'])
+
+        if batch_updates >= config.mutation_batch_size:
+            yield batch
+            batch = []
+            batch_updates = 0
+
+    if batch:
+        yield batch
+
+
+def log_projected_cost(pending):
+    """
+    Log the rate limit cost of the writes of the pending items before they are sent
+    """
+    if not pending:
+        return
+
+    # One mutation per batch that updates fields and one comment per item
+    mutations = sum(1 for batch in batch_field_updates(pending) if any(entry['updates'] for entry in batch))
+    writes = mutations + len(pending)
+    cost = graphql.client.tokens.projected_cost(writes=writes)
+    logger.info(
+        f"Projected cost of {writes} writes: {cost['points']} points, "
+        f"{cost['secondary_points']} secondary points, about {cost['seconds']:.0f} seconds | "
+        f"Remaining points: {cost['remaining']}"
+    )
+
+
+def process_items(issues, schema, comments_issue=None, digest=None, markers=None, journal=None, plan=None):
+    """
+    Compute and send all the writes of a page of items: one bulk mutation per batch of
+    items and at most one comment per item. In plan mode, the writes are added to the plan.
+
+    :return: The IDs of the items whose writes failed or could not be decided
+    """
+    candidates = due_date_candidates(issues)
+    latest_comments = lookup_due_date_comments(candidates, markers)
+    pending = plan_item_writes(issues, candidates, schema, latest_comments)
+    failed = unread_items(issues, candidates, latest_comments)
+
+    if plan is not None:
+        plan.add(pending)
+        return failed
+    if config.dry_run:
+        log_planned_writes(pending, comments_issue, digest)
+        return failed
+
+    log_projected_cost(pending)
+
+    for batch in batch_field_updates(pending):
+        failed |= apply_item_writes(schema.project_id, batch, comments_issue, digest, markers, journal)
+
+    return failed
+
+
+def apply_item_writes(project_id, pending, comments_issue, digest=None, markers=None, journal=None):
+    """
+    Apply the field updates of the pending items in bulk, then comment on every item
+
+    :return: The IDs of the items whose field updates or comments failed
+    """
+    failed_items = update_items_fields(project_id, pending, journal)
 
-        # Apply updates if not in dry run mode
+    failed_comments = {
+        entry['item'].id for entry in pending
+        if not comment_on_item(entry, comments_issue, failed_items, digest, markers, journal)
+    }
+
+    return failed_items | failed_comments
+
+
+def update_items_fields(project_id, pending, journal=None):
+    """
+    Send the field updates of the pending items and return the IDs of the items that failed
+    """
+    items = []
+    for entry in pending:
+        updates = entry['updates']
+        # The updates the interrupted run already applied are not sent again
+        if journal:
+            updates = [update for update in updates if not journal.applied_update(entry['item'].id, update)]
         if updates:
-            # Constructing the comment
-            comment = "The following fields have been updated:\n" + "\n".join(
-                [f"- {item['field']}: **{item['value']}**" for item in comment_fields]
+            items.append({'item_id': entry['item'].id, 'updates': updates})
+    if not items:
+        return set()
+
+    errors = graphql.update_project_items_fields(project_id=project_id, items=items)
+    failed_items = {error['item_id'] for error in errors}
+    run_metrics.count('updated_items', len(items) - len(failed_items))
+
+    if journal:
+        for item in items:
+            if item['item_id'] not in failed_items:
+                journal.record_updates(item['item_id'], item['updates'])
+        if failed_items:
+            journal.record_failure()
+
+    return failed_items
+
+
+def item_comments(entry, comments_issue, failed_items=(), digest=None):
+    """
+    Return the (target, comment) pairs of the item. The summary of the updated fields and
+    the due date notice are combined into one comment on the issue, unless the summaries
+    are collected in the comments issue, or in the digest that is posted to it at the end.
+    """
+    item = entry['item']
+    issue = item.issue
+
+    summary = entry['comment']
+    if summary and item.id in failed_items:
+        logger.error(f"Fields of {issue.url} could not be updated, skipping their summary")
+        summary = None
+
+    comments = []
+    if summary and comments_issue and digest:
+        digest.add(issue, entry['fields'])
+        summary = None
+    elif summary and comments_issue:
+        comments.append((comments_issue['id'], f"Issue {issue.url}: {summary}"))
+        summary = None
+
+    body = '\n\n'.join(part for part in (summary, entry['notice']) if part)
+    if body:
+        comments.append((issue.id, body))
+
+    return comments
+
+
+def comment_on_item(entry, comments_issue, failed_items, digest=None, markers=None, journal=None):
+    """
+    Add the comments of the item and return False if one of them failed
+    """
+    issue = entry['item'].issue
+    added = True
+
+    for target, comment in item_comments(entry, comments_issue, failed_items, digest):
+        if journal and journal.applied_comment(target, comment):
+            logger.info(f"Comment on {issue.url} already added by the interrupted run")
+            continue
+
+        if not utils.post_comment(target, comment):
+            logger.error(f"Failed to add comment to {issue.url} (ID: {target})")
+            if journal:
+                journal.record_failed_comment(target, comment)
+            added = False
+            continue
+
+        run_metrics.count('comments')
+        if journal:
+            journal.record_comment(target, comment)
+
+        # Remember the markers of the comment for the next runs
+        if markers:
+            markers.record(comment)
+
+        # Log the output
+        logger.info(f"Comment has been added to: {issue.url} with comment {comment}")
+        if entry['due_date'] and target == issue.id:
+            logger.info(f"Comment added to issue with title {issue.title}. Due date is {entry['due_date']}.")
+
+    return added
+
+
+def process_pages(pages, schema, comments_issue, digest=None, markers=None, journal=None, plan=None, snapshot=None):
+    """
+    Process the (items, cursor) pages of the sweep, checkpointing the journal after every page.
+    The items that failed are left out of the snapshot, for the next incremental run to retry them.
+    Return whether issues were found and the number of items that failed.
+    """
+    pages = utils.prefetch(pages, size=config.prefetch_pages)
+
+    issues_found = False
+    failed_items = 0
+    while True:
+        with run_metrics.phase('fetch_items'):
+            page = next(pages, None)
+        if page is None:
+            break
+        issues, cursor = page
+        if issues:
+            issues_found = True
+            run_metrics.count('items', len(issues))
+
+            # Update the fields and notify the due date changes of the items in one pass
+            with run_metrics.phase('process_items'):
+                failed = process_items(issues, schema, comments_issue, digest, markers, journal, plan)
+            failed_items += len(failed)
+            if snapshot:
+                snapshot.discard(failed)
+
+        if journal:
+            journal.checkpoint(cursor, digest)
+
+    return issues_found, failed_items
+
+
+async def process_pages_async(pages, schema, comments_issue, digest=None, markers=None, journal=None, plan=None,
+                              snapshot=None):
+    """
+    Same as process_pages, with the reads and the writes of every page sent concurrently
+    """
+    pages = utils.prefetch(pages, size=config.prefetch_pages)
+
+    issues_found = False
+    failed_items = 0
+    while True:
+        with run_metrics.phase('fetch_items'):
+            page = await asyncio.to_thread(next, pages, None)
+        if page is None:
+            break
+        issues, cursor = page
+        if issues:
+            issues_found = True
+            run_metrics.count('items', len(issues))
+
+            with run_metrics.phase('process_items'):
+                failed = await process_items_async(issues, schema, comments_issue, digest, markers, journal, plan)
+            failed_items += len(failed)
+            if snapshot:
+                snapshot.discard(failed)
+
+        if journal:
+            await asyncio.to_thread(journal.checkpoint, cursor, digest)
+
+    return issues_found, failed_items
+
+
+async def process_items_async(issues, schema, comments_issue=None, digest=None, markers=None, journal=None, plan=None):
+    candidates = due_date_candidates(issues)
+    latest_comments = await lookup_due_date_comments_async(candidates, markers)
+    pending = plan_item_writes(issues, candidates, schema, latest_comments)
+    failed = unread_items(issues, candidates, latest_comments)
+
+    if plan is not None:
+        plan.add(pending)
+        return failed
+    if config.dry_run:
+        log_planned_writes(pending, comments_issue, digest)
+        return failed
+
+    log_projected_cost(pending)
+
+    return failed | await apply_pending_async(schema.project_id, pending, comments_issue, digest, markers, journal)
+
+
+async def apply_pending_async(project_id, pending, comments_issue, digest=None, markers=None, journal=None):
+    """
+    Apply the writes of the pending items with one concurrent bulk mutation per batch,
+    and return the IDs of the items that failed
+    """
+    results = await asyncio.gather(*(
+        apply_item_writes_async(project_id, batch, comments_issue, digest, markers, journal)
+        for batch in batch_field_updates(pending)
+    ))
+
+    return set().union(*results)
+
+
+async def lookup_due_date_comments_async(candidates, markers=None):
+    latest_comments = indexed_due_date_comments(candidates, markers)
+    candidates = [(issue, due_date_obj) for issue, due_date_obj in candidates if issue.id not in latest_comments]
+    if not candidates:
+        return latest_comments
+
+    author_login = await graphql.async_client.call(graphql.get_viewer_logins)
+
+    # Look up the latest due date comments with one concurrent read per batch of issues
+    batches = [
+        candidates[start:start + graphql.COMMENT_LOOKUP_BATCH_SIZE]
+        for start in range(0, len(candidates), graphql.COMMENT_LOOKUP_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*(
+        graphql.async_client.call(
+            graphql.get_latest_matching_comments,
+            issue_ids=[issue.id for issue, _ in batch],
+            contains=DUEDATE_COMMENT_MATCH,
+            author_login=author_login
+        )
+        for batch in batches
+    ))
+
+    for result in results:
+        latest_comments.update(result)
+    index_announced_due_dates(candidates, latest_comments, markers)
+
+    return latest_comments
+
+
+async def apply_item_writes_async(project_id, pending, comments_issue, digest=None, markers=None, journal=None):
+    failed_items = await graphql.async_client.call(update_items_fields, project_id, pending, journal, write=True)
+
+    # The comments of the batch are only sent once its field updates are applied
+    added = await asyncio.gather(*(
+        graphql.async_client.call(
+            comment_on_item, entry, comments_issue, failed_items, digest, markers, journal, write=True
+        )
+        for entry in pending
+    ))
+
+    return failed_items | {entry['item'].id for entry, ok in zip(pending, added) if not ok}
+
+
+def project_item_pages(target, project, after=None):
+    """
+    Return the (items, cursor) pages of the open issues of the project to sweep, starting
+    after the given cursor, the snapshot that filters them in incremental mode and the
+    download stats the pages fill
+    """
+    # Stream the open issues of the project, so that each page is processed
+    # while the next one is being fetched
+    download_stats = {}
+    pages = graphql.iter_project_issue_pages(
+        owner=target.owner,
+        owner_type=target.owner_type,
+        project_number=target.number,
+        filters={'open_only': True},
+        after=after,
+        stats=download_stats,
+        cursors=True
+    )
+
+    # Every shard of the sweep only resolves and writes its own share of the items
+    if shards.is_sharded():
+        logger.info(f'Shard {config.shard_index + 1}/{config.shard_count}')
+        pages = (
+            (shards.filter_shard(issues, config.shard_index, config.shard_count), cursor)
+            for issues, cursor in pages
+        )
+
+    # Only the items that changed since the last run are processed in incremental mode
+    snapshot = None
+    if config.incremental and config.cache_dir:
+        snapshot = cache.ItemSnapshot(
+            owner=target.owner,
+            project_number=target.number,
+            project=project,
+            today=datetime.today().date()
+        )
+        pages = ((snapshot.filter_changed(issues), cursor) for issues, cursor in pages)
+    elif config.incremental:
+        logger.info('Incremental mode needs the cache, running a full scan')
+
+    return pages, snapshot, download_stats
+
+
+def process_event(schema, comments_issue, digest=None, markers=None, plan=None):
+    """
+    Process the item of the projects_v2_item or issues event that triggered the run.
+    Return whether the item was processed and the number of items that failed.
+    """
+    logger.info(f'Event mode: processing the item of the {config.event_name} event')
+    item = events.event_item(config.event_name, events.load_event(), schema.project_id)
+    if not item:
+        return False, 0
+
+    # Every job of a matrix receives the event, only the shard of the item processes it
+    if shards.is_sharded() and shards.shard_of(item.id, config.shard_count) != config.shard_index:
+        logger.info(f'Event mode: the item belongs to another shard than {config.shard_index + 1}/{config.shard_count}')
+        return False, 0
+
+    run_metrics.count('items', 1)
+    failed = process_items([item], schema, comments_issue, digest, markers, plan=plan)
+    return True, len(failed)
+
+
+def process_project(target, comments_issue, run_digest=None):
+    """
+    Process one project of the run: the item of the event that triggered the run, or the
+    sweep of its items. Return whether issues were found, the download stats of the sweep,
+    whether the project was interrupted by a read that failed and the number of items that failed.
+
+    A failed read stops the sweep of the project, the writes made so far are kept
+    and the journal keeps the checkpoint for the next run to resume from.
+    """
+    logger.info(f'Processing project {target.label}')
+    read_only = config.dry_run or config.run_mode == 'plan'
+
+    # The project collects its own digest items, which its journal records, and adds them to the digest of the run
+    digest = None
+    if run_digest:
+        digest = CommentDigest(group_by=run_digest.group_by, rolling=run_digest.rolling)
+
+    # Fetch the project details from GraphQL
+    try:
+        with run_metrics.phase('fetch_schema'):
+            project = cache.get_project(
+                organization_name=target.owner,
+                project_number=target.number,
+                owner_type=target.owner_type
+            )
+            schema = ProjectSchema(project)
+    except graphql.ProjectReadError as e:
+        logger.error(f'Project {target.label}: {e}, skipping it')
+        return False, None, True, 0
+
+    # A plan run resolves the writes like a dry run, and writes them to the plan file
+    plan = None
+    if config.run_mode == 'plan':
+        plan = MutationPlan(project_id=schema.project_id, comments_issue=comments_issue)
+
+    # The markers of the comments written by the action are indexed in the cache
+    markers = None
+    if config.cache_dir:
+        markers = cache.MarkerIndex(owner=target.owner, project_number=target.number)
+
+    snapshot = None
+    download_stats = None
+    journal = None
+    interrupted = False
+    failed_items = 0
+    if events.event_mode():
+        # Only the item of the event is processed, with a constant number of requests
+        try:
+            with run_metrics.phase('process_event'):
+                issues_found, failed_items = process_event(schema, comments_issue, digest, markers, plan)
+        except (graphql.ProjectReadError, requests.RequestException) as e:
+            logger.error(f'Project {target.label}: {e}, skipping the event')
+            issues_found, interrupted = False, True
+    else:
+        # The journal lets the next run resume the sweep if this one is interrupted
+        if config.journal and config.cache_dir and not read_only:
+            journal = Journal(
+                owner=target.owner,
+                project_number=target.number,
+                project=project,
+                today=datetime.today().date()
             )
+            journal.restore(digest, markers)
+            journal.replay_comments(markers)
+        elif config.journal and not read_only:
+            logger.info('The journal needs the cache, the run cannot be resumed if interrupted')
+
+        pages, snapshot, download_stats = project_item_pages(target, project, after=journal.cursor if journal else None)
+        if journal and journal.resumed and snapshot:
+            snapshot.keep_unseen = True
 
-            if not config.dry_run:
-                graphql.update_project_item_fields(
-                    project_id=project['id'],
-                    item_id=issue['id'],
-                    updates=updates
+        try:
+            if config.async_mode:
+                issues_found, failed_items = asyncio.run(
+                    process_pages_async(pages, schema, comments_issue, digest, markers, journal, plan, snapshot)
                 )
+            else:
+                issues_found, failed_items = process_pages(pages, schema, comments_issue, digest, markers, journal, plan, snapshot)
+        except (graphql.ProjectReadError, requests.RequestException) as e:
+            logger.error(f'Project {target.label}: {e}, stopping the sweep')
+            issues_found, interrupted = False, True
+        finally:
+            if journal:
+                journal.close()
+
+    # A partial plan would leave the rest of the project out when applied
+    if plan and not interrupted:
+        plan.save(plan_path(target))
+    if digest:
+        run_digest.merge(digest.items)
+
+    # The snapshot is only kept once the sweep went through, the markers record the comments written anyway
+    if snapshot and not read_only and not interrupted:
+        snapshot.save()
+    if markers and not read_only:
+        markers.save()
+    if journal and not interrupted:
+        journal.finish()
+
+    if download_stats is not None:
+        graphql.log_download_stats(download_stats)
+
+    if failed_items:
+        logger.error(f'Project {target.label}: {failed_items} items failed')
+
+    return issues_found, download_stats, interrupted, failed_items
+
+
+def for_each_project(targets, func):
+    """
+    Call func(target) for every project, up to project_concurrency projects at once,
+    with the metrics of every project recorded in its own scope. The projects share
+    the pooled client, its rate limit budget and the caches.
+    """
+    def run(target):
+        with run_metrics.scope(target.label):
+            return func(target)
+
+    if len(targets) == 1:
+        return [run(targets[0])]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(config.project_concurrency, len(targets)))) as executor:
+        return list(executor.map(run, targets))
+
+
+def combine_download_stats(download_stats):
+    download_stats = [stats for stats in download_stats if stats is not None]
+    if not download_stats:
+        return None
+
+    return {key: sum(stats[key] for stats in download_stats) for key in download_stats[0]}
+
+
+def merge_shard_results():
+    """
+    Combine the results of the shards of a sweep into one report, and post the digest
+    of all the shards to the comments issue
+    """
+    results = shards.read_results()
+    if not results:
+        return
 
-                # Add a comment summarizing the updated fields
-                if comments_issue:
-                    comment = f"Issue {issue['content']['url']}: {comment}"
-                    graphql.add_issue_comment(comments_issue['id'], comment)
-                else:
-                    graphql.add_issue_comment(issue['content']['id'], comment)
+    summary = merge_summaries([dict(result['summary'], shard=result['shard_index']) for result in results])
+    write_report(summary)
+
+    comments_issue = get_comments_issue() if config.comments_digest else None
+    if comments_issue:
+        digest = CommentDigest(group_by=config.comments_digest_group_by, rolling=config.comments_digest_rolling)
+        for result in results:
+            digest.merge(result['digest'])
+        if not digest.publish(comments_issue, dry_run=config.dry_run):
+            sys.exit(1)
+
+
+def drop_announced_writes(pending, markers):
+    """
+    Leave out the comments that the marker index records as sent, by an earlier apply of
+    the same plan, along with the field updates that their summary reports as applied
+    """
+    remaining = []
+    for entry in pending:
+        if entry['comment'] and markers.announced(entry['comment']):
+            entry['comment'] = None
+            entry['updates'] = []
+        if entry['notice'] and markers.announced(entry['notice']):
+            entry['due_date'], entry['notice'] = None, None
+
+        if entry['updates'] or entry['comment'] or entry['notice']:
+            remaining.append(entry)
+
+    if len(remaining) < len(pending):
+        logger.info(f'{len(pending) - len(remaining)} items of the plan were applied already, skipping them')
+
+    return remaining
+
+
+def apply_plan(target, plan, comments_issue, digest=None):
+    """
+    Apply the writes of the plan of a project without reading the project:
+    all the bulk mutations of the plan are sent concurrently. Return the number of items that failed.
+    """
+    markers = None
+    if config.cache_dir:
+        markers = cache.MarkerIndex(owner=target.owner, project_number=target.number)
+
+    pending = plan.pending()
+    if markers:
+        pending = drop_announced_writes(pending, markers)
+    run_metrics.count('items', len(pending))
+    if config.dry_run:
+        log_planned_writes(pending, comments_issue, digest)
+        return 0
+
+    log_projected_cost(pending)
+    with run_metrics.phase('apply_plan'):
+        failed = asyncio.run(apply_pending_async(plan.project_id, pending, comments_issue, digest, markers))
+
+    if markers:
+        markers.save()
+
+    # A plan whose writes all went through is not applied again, the others are retried by the next apply
+    if failed:
+        logger.error(f'{len(failed)} items of the plan failed, the plan can be applied again to retry them')
+    else:
+        plan.mark_applied(plan_path(target))
+
+    return len(failed)
+
+
+def apply_plans(targets):
+    """
+    Apply the plan files made by a plan run, then post the digest
+    """
+    plans = {target: MutationPlan.load(plan_path(target)) for target in targets}
+    plans = {target: plan for target, plan in plans.items() if plan}
+    if not plans:
+        return
+
+    comments_issue = next((plan.comments_issue for plan in plans.values() if plan.comments_issue), None)
+    digest = None
+    if config.comments_digest and comments_issue:
+        digest = CommentDigest(group_by=config.comments_digest_group_by, rolling=config.comments_digest_rolling)
+
+    failed_items = sum(
+        for_each_project(list(plans), lambda target: apply_plan(target, plans[target], comments_issue, digest))
+    )
+
+    sharded = shards.is_sharded()
+    published = True
+    if digest and not sharded:
+        with run_metrics.phase('publish_digest'):
+            published = digest.publish(comments_issue, dry_run=config.dry_run)
+
+    summary = run_metrics.report(extra={'connections': log_connection_stats()})
+    if sharded:
+        shards.write_results(summary, digest)
+
+    if failed_items or not published:
+        sys.exit(1)
 
-            # Log the output
-            logger.info(f"Comment has been added to: {issue['content']['url']} with comment {comment}")
+
+def log_connection_stats():
+    stats = graphql.client.connection_stats()
+    logger.info(
+        f"Requests: {stats['requests']} | "
+        f"New connections: {stats['new_connections']} | "
+        f"Reused connections: {stats['reused_connections']}"
+    )
+    if len(graphql.client.tokens) > 1:
+        for token in graphql.client.tokens.stats():
+            logger.info(f"Requests with {token['token']}: {token['requests']} | Points left: {token['remaining']}")
+
+    return stats
 
 
 def main():
@@ -195,24 +898,78 @@ def main():
     if config.dry_run:
         logger.info('DRY RUN MODE ON!')
 
-    # Fetch all open issues from the project
-    issues = graphql.get_project_issues(
-        owner=config.repository_owner,
-        owner_type=config.repository_owner_type,
-        project_number=config.project_number,
-        filters={'open_only': True}
-    )
+    if config.run_mode == 'merge':
+        merge_shard_results()
+        logger.info('Process finished...')
+        return
 
-    # Exit if no issues are found
-    if not issues:
-        logger.info('No issues have been found')
+    if shards.is_sharded() and not 0 <= config.shard_index < config.shard_count:
+        logger.error(f'Invalid shard index {config.shard_index} of {config.shard_count} shards')
         return
 
-    # Process the issues to update fields
-    update_fields(issues)
+    targets = project_targets()
+    if not targets:
+        logger.error('No project to process, set project_number or projects')
+        return
+
+    if config.run_mode == 'apply':
+        apply_plans(targets)
+        logger.info('Process finished...')
+        return
+
+    if config.run_mode == 'plan':
+        logger.info('PLAN MODE ON!')
+
+    if (config.incremental or config.journal) and not config.cache_dir:
+        logger.info('Incremental mode and the journal need a cache, set cache_dir to use them')
+
+    try:
+        with run_metrics.phase('fetch_schema'):
+            comments_issue = get_comments_issue()
+    except graphql.ProjectReadError as e:
+        logger.error(f'{e}, stopping the run')
+        run_metrics.report(extra={'connections': log_connection_stats()})
+        sys.exit(1)
+
+    # The summaries of the updated items are posted to the comments issue at the end in digest mode,
+    # the digest of a plan is made when it is applied
+    digest = None
+    if config.comments_digest and comments_issue and config.run_mode != 'plan':
+        digest = CommentDigest(group_by=config.comments_digest_group_by, rolling=config.comments_digest_rolling)
+    elif config.comments_digest and not comments_issue:
+        logger.info('Digest mode needs a comments issue, commenting on the items instead')
+
+    results = for_each_project(targets, lambda target: process_project(target, comments_issue, digest))
+    issues_found = any(found for found, _, _, _ in results)
+    download_stats = combine_download_stats([stats for _, stats, _, _ in results])
+    interrupted = sum(1 for _, _, stopped, _ in results if stopped)
+    failed_items = sum(failed for _, _, _, failed in results)
+    sharded = shards.is_sharded() and not events.event_mode()
+
+    # The merge step posts the digest of all the shards at once
+    published = True
+    if digest and not sharded:
+        with run_metrics.phase('publish_digest'):
+            published = digest.publish(comments_issue, dry_run=config.dry_run)
+
+    stats = log_connection_stats()
+    summary = run_metrics.report(extra={'connections': stats, 'downloads': download_stats})
+    # The shards of a plan report when their plans are applied
+    if sharded and config.run_mode != 'plan':
+        shards.write_results(summary, digest)
+
+    # The run fails once everything it could do is done and reported, so that a scheduler sees it
+    if interrupted:
+        logger.error(f'{interrupted} of {len(targets)} projects could not be read completely, the next run resumes them')
+    if failed_items:
+        logger.error(f'The writes of {failed_items} items failed, the next run retries them')
+    if interrupted or failed_items or not published:
+        sys.exit(1)
 
-    # Process to identify change in the due date and write a comment in the issue
-    notify_due_date_changes(issues)
+    # Exit if no issues are found
+    if not issues_found:
+        logger.info('No issues have been found')
+        return
 
     logger.info('Process finished...')
 
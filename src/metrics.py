@@ -0,0 +1,270 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logger import logger
+
+# The metrics of the project being processed, when a run processes several projects
+current_scope = contextvars.ContextVar('metrics_scope', default=None)
+
+
+class Metrics:
+    """
+    Collects the per-request records of the GraphQL client, tagged by the
+    graphql.py function that sent them, and the time spent in every phase of the run.
+
+    Inside scope(), everything is also recorded in the metrics of the scope, which
+    the threads and the tasks started there inherit.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.functions = {}
+        self.phases = {}
+        self.counters = {}
+        self.scopes = {}
+        self.finished_at = None
+
+    @contextmanager
+    def scope(self, name):
+        with self.lock:
+            scoped = self.scopes.setdefault(name, Metrics())
+        token = current_scope.set(scoped)
+        try:
+            yield scoped
+        finally:
+            current_scope.reset(token)
+            scoped.finished_at = time.perf_counter()
+
+    def record(self, record):
+        """
+        Hook of the GraphQL client, called once per request
+        """
+        self._record(record)
+        scoped = current_scope.get()
+        if scoped is not None:
+            scoped._record(record)
+
+    def _record(self, record):
+        with self.lock:
+            entry = self.functions.setdefault(record['function'], {
+                'operation': record['operation'],
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'cost': 0,
+                'latency': 0.0,
+                'max_latency': 0.0,
+                'request_bytes': 0,
+                'response_bytes': 0
+            })
+            entry['requests'] += 1
+            entry['errors'] += int(record['error'])
+            entry['retries'] += record['retries']
+            entry['cost'] += record['cost']
+            entry['latency'] += record['latency']
+            entry['max_latency'] = max(entry['max_latency'], record['latency'])
+            entry['request_bytes'] += record['request_bytes']
+            entry['response_bytes'] += record['response_bytes']
+
+    def count(self, name, value=1):
+        self._count(name, value)
+        scoped = current_scope.get()
+        if scoped is not None:
+            scoped._count(name, value)
+
+    def _count(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the run, adding up every time it is entered
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._add_phase(name, elapsed)
+            scoped = current_scope.get()
+            if scoped is not None:
+                scoped._add_phase(name, elapsed)
+
+    def _add_phase(self, name, elapsed):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def summary(self):
+        with self.lock:
+            functions = {}
+            for function, entry in self.functions.items():
+                functions[function] = dict(entry)
+                functions[function]['latency'] = round(entry['latency'], 3)
+                functions[function]['max_latency'] = round(entry['max_latency'], 3)
+                functions[function]['avg_latency'] = round(entry['latency'] / entry['requests'], 4)
+
+            wall_time = (self.finished_at or time.perf_counter()) - self.started_at
+            summary = {
+                'wall_time': round(wall_time, 3),
+                'requests': sum(entry['requests'] for entry in self.functions.values()),
+                'errors': sum(entry['errors'] for entry in self.functions.values()),
+                'cost': sum(entry['cost'] for entry in self.functions.values()),
+                'phases': {name: round(elapsed, 3) for name, elapsed in self.phases.items()},
+                'counters': dict(self.counters),
+                'functions': functions
+            }
+            scopes = dict(self.scopes)
+
+        # The metrics of every project, when the run processes several of them
+        if len(scopes) > 1:
+            summary['projects'] = {name: scoped.project_summary() for name, scoped in scopes.items()}
+
+        return summary
+
+    def project_summary(self):
+        """
+        The totals of a scope, without the per-function details
+        """
+        summary = self.summary()
+        del summary['functions']
+        return summary
+
+    def report(self, extra=None):
+        """
+        Log the summary as JSON and add it to the step summary of the GitHub Actions job
+        """
+        summary = self.summary()
+        if extra:
+            summary.update(extra)
+
+        write_report(summary)
+
+        return summary
+
+
+def write_report(summary):
+    logger.info(f'Run metrics: {json.dumps(summary, sort_keys=True)}')
+
+    path = os.environ.get('GITHUB_STEP_SUMMARY')
+    if path:
+        with open(path, 'a') as f:
+            f.write(format_step_summary(summary))
+
+
+def merge_summaries(summaries):
+    """
+    Combine the summaries of the shards of a run. The wall time is the one of the
+    slowest shard, the other metrics add up.
+    """
+    merged = {
+        'wall_time': max(summary['wall_time'] for summary in summaries),
+        'requests': sum(summary['requests'] for summary in summaries),
+        'errors': sum(summary['errors'] for summary in summaries),
+        'cost': sum(summary['cost'] for summary in summaries),
+        'phases': {},
+        'counters': {},
+        'functions': {},
+        'shards': []
+    }
+
+    projects = {}
+    for index, summary in enumerate(summaries):
+        for name, project in summary.get('projects', {}).items():
+            projects.setdefault(name, []).append(project)
+
+        for name, elapsed in summary['phases'].items():
+            merged['phases'][name] = round(merged['phases'].get(name, 0.0) + elapsed, 3)
+        for name, value in summary['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+
+        for function, entry in summary.get('functions', {}).items():
+            total = merged['functions'].setdefault(function, dict(entry, requests=0, errors=0, retries=0, cost=0,
+                                                                  latency=0.0, max_latency=0.0,
+                                                                  request_bytes=0, response_bytes=0))
+            for key in ('requests', 'errors', 'retries', 'cost', 'latency', 'request_bytes', 'response_bytes'):
+                total[key] += entry[key]
+            total['latency'] = round(total['latency'], 3)
+            total['max_latency'] = max(total['max_latency'], entry['max_latency'])
+            total['avg_latency'] = round(total['latency'] / total['requests'], 4) if total['requests'] else 0
+
+        merged['shards'].append({
+            'shard': summary.get('shard', index),
+            'wall_time': summary['wall_time'],
+            'requests': summary['requests'],
+            'items': summary['counters'].get('items', 0)
+        })
+
+    for name, project_summaries in projects.items():
+        project = merge_summaries(project_summaries)
+        del project['functions'], project['shards']
+        merged.setdefault('projects', {})[name] = project
+
+    return merged
+
+
+def format_step_summary(summary):
+    lines = [
+        '## Project automations run metrics',
+        '',
+        f"Wall time: {summary['wall_time']}s | Requests: {summary['requests']} | "
+        f"Errors: {summary['errors']} | Cost: {summary['cost']} points",
+        '',
+    ]
+    if summary.get('projects'):
+        lines += [
+            '| Project | Wall time (s) | Requests | Errors | Items | Updated items | Comments |',
+            '| --- | ---: | ---: | ---: | ---: | ---: | ---: |',
+        ]
+        lines += [
+            f"| {name} | {project['wall_time']} | {project['requests']} | {project['errors']} | "
+            f"{project['counters'].get('items', 0)} | {project['counters'].get('updated_items', 0)} | "
+            f"{project['counters'].get('comments', 0)} |"
+            for name, project in sorted(summary['projects'].items())
+        ]
+        lines.append('')
+    if summary.get('shards'):
+        lines += [
+            '| Shard | Wall time (s) | Requests | Items |',
+            '| ---: | ---: | ---: | ---: |',
+        ]
+        lines += [
+            f"| {shard['shard']} | {shard['wall_time']} | {shard['requests']} | {shard['items']} |"
+            for shard in summary['shards']
+        ]
+        lines.append('')
+    lines += [
+        '| Phase | Seconds |',
+        '| --- | ---: |',
+    ]
+    lines += [f'| {name} | {elapsed} |' for name, elapsed in summary['phases'].items()]
+    lines += [
+        '',
+        '| Function | Operation | Requests | Errors | Retries | Cost | Avg latency (s) | Bytes sent | Bytes received |',
+        '| --- | --- | ---: | ---: | ---: | ---: | ---: | ---: | ---: |',
+    ]
+    lines += [
+        f"| {function} | {entry['operation']} | {entry['requests']} | {entry['errors']} | {entry['retries']} | "
+        f"{entry['cost']} | {entry['avg_latency']} | {entry['request_bytes']} | {entry['response_bytes']} |"
+        for function, entry in sorted(summary['functions'].items())
+    ]
+    lines += [
+        '',
+        '<details><summary>JSON</summary>',
+        '',
+        '```json',
+        json.dumps(summary, indent=2, sort_keys=True),
+        '```',
+        '',
+        '</details>',
+        '',
+    ]
+    return '\n'.join(lines)
+
+
+# The metrics of the current run
+run_metrics = Metrics()
@@ -0,0 +1,93 @@
+import sys
+from datetime import date
+from logger import logger
+
+
+def intern(value):
+    """
+    Intern the IDs and names shared by many items, so that every item refers to the same string
+    """
+    return sys.intern(value) if value is not None else None
+
+
+class Issue:
+    """
+    The issue of a project item, with the values the automations use
+    """
+
+    __slots__ = ('id', 'title', 'number', 'state', 'url', 'assignees')
+
+    def __init__(self, id, title, number, state, url, assignees=()):
+        self.id = id
+        self.title = title
+        self.number = number
+        self.state = state
+        self.url = url
+        self.assignees = assignees
+
+    @classmethod
+    def from_node(cls, node):
+        """
+        Build the issue of an item from its content node, or return None if the content is not an issue
+        """
+        if not node or not node.get('id'):
+            return None
+
+        return cls(
+            id=node['id'],
+            title=node.get('title', 'Unknown Title'),
+            number=node.get('number'),
+            state=intern(node.get('state')),
+            url=node.get('url'),
+            assignees=tuple(
+                intern(assignee['login'])
+                for assignee in (node.get('assignees') or {}).get('nodes', []) if assignee and assignee.get('login')
+            )
+        )
+
+
+class ProjectItem:
+    """
+    A project item reduced to the field values the automations work with: the due date
+    as a date, the name of the estimate and the interned option IDs of the other fields
+    """
+
+    __slots__ = ('id', 'due_date', 'estimate', 'week_id', 'release_id', 'size_id', 'issue')
+
+    def __init__(self, id, issue, due_date=None, estimate=None, week_id=None, release_id=None, size_id=None):
+        self.id = id
+        self.issue = issue
+        self.due_date = due_date
+        self.estimate = estimate
+        self.week_id = week_id
+        self.release_id = release_id
+        self.size_id = size_id
+
+    @classmethod
+    def from_node(cls, node):
+        """
+        Build an item from a ProjectItemFields node of the GraphQL API
+        """
+        return cls(
+            id=node['id'],
+            issue=Issue.from_node(node.get('content')),
+            due_date=parse_date((node.get('dueDate') or {}).get('date')),
+            estimate=intern((node.get('estimate') or {}).get('name')),
+            week_id=intern((node.get('week') or {}).get('id')),
+            release_id=intern((node.get('release') or {}).get('id')),
+            size_id=intern((node.get('size') or {}).get('id'))
+        )
+
+    def __repr__(self):
+        return f'ProjectItem({self.id}, {self.issue.url if self.issue else None})'
+
+
+def parse_date(value):
+    if not value:
+        return None
+
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        logger.error(f"Invalid date {value}")
+        return None
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+import cache
+import config
+import utils
+from logger import logger
+from model import Issue, ProjectItem, parse_date
+from projects import is_multi_project
+
+PLAN_VERSION = 1
+
+
+def plan_path(target=None):
+    """
+    The path of the plan file, with one plan per shard of the sweep and per project
+    when the run processes several projects
+    """
+    root, extension = os.path.splitext(config.plan_path)
+    project_suffix = f'-{target.owner}-{target.number}' if target and is_multi_project() else ''
+    return f'{root}{project_suffix}{cache.shard_suffix()}{extension}'
+
+
+def entry_record(entry):
+    """
+    Return the JSON record of a pending entry, with what item_comments needs of its item.
+    The comments are not kept, as they are made again from the fields and the due date.
+    """
+    item = entry['item']
+    issue = item.issue
+
+    return {
+        'item_id': item.id,
+        'issue': {
+            'id': issue.id,
+            'number': issue.number,
+            'title': issue.title,
+            'url': issue.url,
+            'assignees': list(issue.assignees)
+        },
+        'updates': entry['updates'],
+        'fields': entry['fields'],
+        'due_date': entry['due_date'].isoformat() if entry['due_date'] else None
+    }
+
+
+def record_entry(record):
+    """
+    Build a pending entry back from its JSON record
+    """
+    issue = Issue(
+        id=record['issue']['id'],
+        title=record['issue']['title'],
+        number=record['issue']['number'],
+        state='OPEN',
+        url=record['issue']['url'],
+        assignees=tuple(record['issue']['assignees'])
+    )
+    due_date = parse_date(record['due_date'])
+
+    return {
+        'item': ProjectItem(id=record['item_id'], issue=issue),
+        'updates': record['updates'],
+        'fields': record['fields'],
+        'comment': utils.prepare_fields_comment(issue, record['fields']) if record['fields'] else None,
+        'due_date': due_date,
+        'notice': utils.prepare_duedate_comment(issue, issue.assignees, due_date) if due_date else None
+    }
+
+
+class MutationPlan:
+    """
+    The field updates and the comments a sweep resolved, written to a file in plan mode
+    instead of being sent, so that they can be reviewed and applied by a later run
+    without reading the project again.
+
+    A plan is applied as it was resolved, so it should be applied shortly after it is made.
+    Once all its writes went through, the plan file is stamped as applied and is not
+    applied again.
+    """
+
+    def __init__(self, project_id, comments_issue=None, entries=None, planned_at=None, applied_at=None):
+        self.project_id = project_id
+        self.comments_issue = comments_issue
+        self.entries = entries if entries is not None else []
+        self.planned_at = planned_at or time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.applied_at = applied_at
+        self.lock = threading.Lock()
+
+    def add(self, pending):
+        records = [entry_record(entry) for entry in pending]
+        with self.lock:
+            self.entries.extend(records)
+
+    def pending(self):
+        return [record_entry(record) for record in self.entries]
+
+    def counts(self):
+        updates = sum(len(record['updates']) for record in self.entries)
+        notices = sum(1 for record in self.entries if record['due_date'])
+        return len(self.entries), updates, notices
+
+    def _write(self, path):
+        # Only the fields of the comments issue that the comments need
+        comments_issue = {'id': self.comments_issue['id']} if self.comments_issue else None
+        cache.write_json(path, {
+            'version': PLAN_VERSION,
+            'planned_at': self.planned_at,
+            'applied_at': self.applied_at,
+            'project_id': self.project_id,
+            'comments_issue': comments_issue,
+            'entries': self.entries
+        })
+
+    def save(self, path=None):
+        path = path or plan_path()
+        self._write(path)
+
+        items, updates, notices = self.counts()
+        logger.info(f'Plan written to {path}: {items} items | {updates} field updates | {notices} due date notices')
+
+    def mark_applied(self, path=None):
+        """
+        Stamp the plan file as applied, so that applying it again does nothing
+        """
+        path = path or plan_path()
+        self.applied_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self._write(path)
+        logger.info(f'Plan {path} applied at {self.applied_at}')
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Read a plan file, or return None if it is missing, was written by another version
+        or was applied already
+        """
+        path = path or plan_path()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f'Could not read the plan {path}: {e}')
+            return None
+
+        if data.get('version') != PLAN_VERSION:
+            logger.error(f"The plan {path} has version {data.get('version')}, expected {PLAN_VERSION}")
+            return None
+
+        if data.get('applied_at'):
+            logger.info(f"The plan {path} was already applied at {data['applied_at']}, skipping it")
+            return None
+
+        plan = cls(
+            project_id=data['project_id'],
+            comments_issue=data['comments_issue'],
+            entries=data['entries'],
+            planned_at=data['planned_at']
+        )
+
+        items, updates, notices = plan.counts()
+        logger.info(
+            f'Applying the plan of {plan.planned_at} from {path}: '
+            f'{items} items | {updates} field updates | {notices} due date notices'
+        )
+
+        return plan
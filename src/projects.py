@@ -0,0 +1,73 @@
+import re
+import config
+from logger import logger
+
+OWNER_TYPES = ('organization', 'user')
+
+# [owner_type:][owner/]number
+PROJECT_PATTERN = re.compile(r'^(?:(organization|user):)?(?:([\w.-]+)/)?(\d+)$')
+
+
+class ProjectTarget:
+    """
+    A project processed by the run, which may belong to another owner than the repository
+    """
+
+    def __init__(self, owner, owner_type, number):
+        self.owner = owner
+        self.owner_type = owner_type
+        self.number = number
+
+    @property
+    def label(self):
+        return f'{self.owner}/{self.number}'
+
+    def __eq__(self, other):
+        return isinstance(other, ProjectTarget) and (self.owner, self.number) == (other.owner, other.number)
+
+    def __hash__(self):
+        return hash((self.owner, self.number))
+
+    def __repr__(self):
+        return f'ProjectTarget({self.owner_type}:{self.label})'
+
+
+def parse_projects(value, owner, owner_type):
+    """
+    Parse a comma or newline separated list of projects, as [owner_type:][owner/]number.
+    The owner and its type default to the ones of the repository.
+    """
+    targets = []
+    for entry in re.split(r'[,\n]', value or ''):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        match = PROJECT_PATTERN.match(entry)
+        if not match:
+            logger.error(f'Invalid project {entry}, expected [organization:|user:][owner/]number')
+            continue
+
+        target_owner = match.group(2) or owner
+        target_type = match.group(1) or (owner_type if target_owner == owner else 'organization')
+        target = ProjectTarget(target_owner, target_type, int(match.group(3)))
+        if target not in targets:
+            targets.append(target)
+
+    return targets
+
+
+def project_targets():
+    """
+    Return the projects of the run: the projects input, or else the project number input
+    """
+    if config.projects:
+        return parse_projects(config.projects, config.repository_owner, config.repository_owner_type)
+    if config.project_number:
+        return [ProjectTarget(config.repository_owner, config.repository_owner_type, config.project_number)]
+
+    return []
+
+
+def is_multi_project():
+    return len(project_targets()) > 1
@@ -0,0 +1,146 @@
+import collections
+import threading
+import time
+
+# Secondary rate limit points of a request, as documented by GitHub
+SECONDARY_READ_POINTS = 1
+SECONDARY_WRITE_POINTS = 5
+
+
+class RateLimitScheduler:
+    """
+    Paces the requests of a GraphQL client to stay within the primary point budget
+    of the token and the secondary per-minute limits, sleeping until the budget
+    resets instead of failing.
+    """
+
+    def __init__(self, reserve=100, points_per_minute=1500, write_interval=1.0):
+        self.reserve = reserve
+        self.points_per_minute = points_per_minute
+        self.write_interval = write_interval
+
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        # Set when a response asked to back off
+        self.retry_at = 0
+
+        self.lock = threading.Lock()
+        self.next_write = 0
+        self.window = collections.deque()
+        self.window_points = 0
+
+    def exhausted(self, now=None):
+        """
+        Whether the primary budget is down to the reserve, or a response asked to back off
+        """
+        now = now or time.time()
+        if self.retry_at > now:
+            return True
+
+        return self.remaining is not None and self.remaining <= self.reserve and bool(self.reset_at) and self.reset_at > now
+
+    def available_at(self):
+        """
+        The time from which requests can be sent again
+        """
+        now = time.time()
+        start = max(now, self.retry_at)
+        if self.remaining is not None and self.remaining <= self.reserve and self.reset_at and self.reset_at > now:
+            start = max(start, self.reset_at + 1)
+
+        return start
+
+    def budget(self):
+        """
+        The primary points left, unknown before the first response counts as a full budget
+        """
+        return float('inf') if self.remaining is None else self.remaining
+
+    def wait(self, write=False):
+        """
+        Block until the next request can be sent
+        """
+        points = SECONDARY_WRITE_POINTS if write else SECONDARY_READ_POINTS
+
+        with self.lock:
+            # Wait for the reset once the primary budget is down to the reserve, or for the back off
+            start = self.available_at()
+
+            # Mutations are spaced out, as recommended by GitHub
+            if write:
+                start = max(start, self.next_write)
+                self.next_write = start + self.write_interval
+
+            # Secondary points spent over a sliding minute
+            while self.window and self.window[0][0] <= start - 60:
+                self.window_points -= self.window.popleft()[1]
+            if self.window and self.window_points + points > self.points_per_minute:
+                start = max(start, self.window[0][0] + 60)
+
+            self.window.append((start, points))
+            self.window_points += points
+
+            if self.remaining is not None:
+                self.remaining -= 1
+
+        delay = start - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, response):
+        """
+        Record the rate limit state of a response.
+
+        :return: The number of seconds to wait before retrying the request if it was rate limited, None otherwise
+        """
+        headers = response.headers
+        with self.lock:
+            if headers.get('X-RateLimit-Remaining') is not None:
+                self.remaining = int(headers['X-RateLimit-Remaining'])
+            if headers.get('X-RateLimit-Limit') is not None:
+                self.limit = int(headers['X-RateLimit-Limit'])
+            if headers.get('X-RateLimit-Reset') is not None:
+                self.reset_at = int(headers['X-RateLimit-Reset'])
+
+        delay = self._retry_delay(response)
+        if delay is not None:
+            with self.lock:
+                self.retry_at = time.time() + delay
+
+        return delay
+
+    def _retry_delay(self, response):
+        headers = response.headers
+        until_reset = max((self.reset_at or 0) - time.time(), 0) + 1
+
+        if response.status_code in (403, 429):
+            if headers.get('Retry-After') is not None:
+                return max(float(headers['Retry-After']), 1)
+            if self.remaining == 0:
+                return until_reset
+            if 'rate limit' in response.text.lower():
+                return 60
+
+            return None
+
+        # The primary budget ran out, which GraphQL reports as a RATE_LIMITED error
+        if response.status_code == 200 and b'RATE_LIMITED' in response.content:
+            return until_reset
+
+        return None
+
+    def projected_cost(self, reads=0, writes=0):
+        """
+        Project the cost of the given number of read and write requests
+        """
+        secondary_points = reads * SECONDARY_READ_POINTS + writes * SECONDARY_WRITE_POINTS
+        seconds = max(writes * self.write_interval, secondary_points / self.points_per_minute * 60)
+
+        return {
+            'points': reads + writes,
+            'secondary_points': secondary_points,
+            'seconds': seconds,
+            'remaining': self.remaining,
+            'reset_at': self.reset_at
+        }
@@ -0,0 +1,157 @@
+import json
+import random
+import threading
+import time
+import requests
+from logger import logger
+
+# Server errors that usually pass on their own
+TRANSIENT_STATUS_CODES = (500, 502, 503, 504)
+
+# Messages of the GraphQL errors returned instead of data when the API failed or timed out
+TRANSIENT_MESSAGES = ('something went wrong', 'timeout', 'timed out', 'try again')
+
+
+class TransientError(requests.RequestException):
+    """
+    Raised when a request failed in a way that may pass, after its retries or when it cannot be retried safely
+    """
+
+
+class CircuitOpenError(TransientError):
+    """
+    Raised when the circuit breaker stays open past the deadline of a request
+    """
+
+
+def is_transient(response):
+    """
+    Whether a response is a failure worth retrying: a server error, or a GraphQL
+    response without data because the API failed or timed out
+    """
+    if response.status_code in TRANSIENT_STATUS_CODES:
+        return True
+    if response.status_code != 200 or b'"errors"' not in response.content:
+        return False
+
+    try:
+        data = response.json()
+    except ValueError:
+        return True
+    if not isinstance(data, dict) or data.get('data') is not None:
+        return False
+
+    messages = json.dumps(data.get('errors')).lower()
+    return any(message in messages for message in TRANSIENT_MESSAGES)
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff of the retries of a request, bounded by a number of
+    retries and by a deadline of the whole operation
+    """
+
+    def __init__(self, max_retries=4, base_delay=1.0, max_delay=30.0, deadline=120.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def delay(self, attempt):
+        """
+        The delay before the given retry, between half and all of its exponential backoff
+        """
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(backoff / 2, backoff)
+
+    def backoff(self, attempt, deadline):
+        """
+        Sleep before the given retry and return True, or return False when the retries
+        are spent or the deadline would pass
+        """
+        delay = self.delay(attempt)
+        if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+            return False
+
+        time.sleep(delay)
+        return True
+
+
+class CircuitBreaker:
+    """
+    Stops hammering an API that keeps failing. After `threshold` transient failures in
+    a row the circuit opens: requests wait for the cooldown, then a single request probes
+    the API. Its success closes the circuit, its failure opens it again for twice as long,
+    so that the throughput of a failing run degrades gradually instead of aborting it.
+
+    Once the circuit has been open for longer than `patience`, the requests fail right
+    away instead of waiting, except for the probes, so that an outage ends the run in
+    a bounded time.
+    """
+
+    def __init__(self, threshold=5, cooldown=10.0, max_cooldown=120.0, patience=120.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.patience = patience
+
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.cooldown = cooldown
+        self.open_until = 0
+        self.opened_at = 0
+        self.probing = False
+
+    @property
+    def is_open(self):
+        return self.threshold > 0 and self.failures >= self.threshold
+
+    def wait(self, deadline):
+        """
+        Block until the circuit lets a request through
+
+        :raise CircuitOpenError: When the circuit stays open past the deadline, or has been open for too long
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if not self.is_open:
+                    return
+                if now >= self.open_until:
+                    # This request is the probe, the next one waits for it or for another cooldown
+                    self.open_until = now + self.cooldown
+                    self.probing = True
+                    return
+                until = self.open_until
+                given_up = now - self.opened_at > self.patience
+
+            if given_up or until > deadline:
+                raise CircuitOpenError(f'Circuit open for another {until - now:.0f} seconds')
+            # Woken up regularly, as the probe of another thread may close the circuit
+            time.sleep(min(until - now, 1))
+
+    def success(self):
+        with self.lock:
+            if self.is_open:
+                logger.info('API responding again, circuit closed')
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            was_open = self.is_open
+            self.failures += 1
+            if not self.is_open:
+                return
+
+            if was_open and not self.probing:
+                # A request sent before the circuit opened
+                return
+            if self.probing:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.probing = False
+            else:
+                self.opened_at = time.monotonic()
+            self.open_until = time.monotonic() + self.cooldown
+            logger.info(f'{self.failures} failed requests in a row, circuit open for {self.cooldown:.0f} seconds')
@@ -0,0 +1,61 @@
+import config
+import utils
+
+
+class ProjectSchema:
+    """
+    The fields of a project indexed by name, built once per run from get_project.
+
+    Resolving the Week, Release and Size of an item only takes dictionary lookups:
+    the iterations and the release calendar are indexed once, and every due date and
+    estimate is resolved at most once per run.
+    """
+
+    def __init__(self, project):
+        self.project_id = project['id']
+        self.fields = {
+            field['name']: field
+            for field in project['fields']['nodes'] if field and field.get('name')
+        }
+
+        self.week_field = self.fields.get(config.week_field_name)
+        self.release_field = self.fields.get(config.release_field_name)
+        self.size_field = self.fields.get(config.size_field_name)
+
+        self.weeks = None
+        if self.week_field:
+            configuration = self.week_field['configuration']
+            self.weeks = utils.IterationIndex(configuration['iterations'] + configuration['completedIterations'])
+
+        self.releases = utils.ReleaseCalendar(self.release_field['options']) if self.release_field else None
+
+        self._dates = {}
+        self._sizes = {}
+
+    def field_id(self, name):
+        field = self.fields.get(name)
+        return field['id'] if field else None
+
+    def resolve_due_date(self, due_date):
+        """
+        Return the (week, release) options of a due date, None for the fields that cannot be resolved
+        """
+        if due_date not in self._dates:
+            date_str = due_date.isoformat()
+            week = self.weeks.find_week(date_str=date_str) if self.weeks else None
+            release = self.releases.find_release(date_str=date_str) if self.releases else None
+            self._dates[due_date] = (week, release)
+
+        return self._dates[due_date]
+
+    def resolve_estimate(self, estimate_name):
+        """
+        Return the size option of an estimate, or None if it cannot be resolved
+        """
+        if estimate_name not in self._sizes:
+            size = None
+            if self.size_field:
+                size = utils.find_size(sizes=self.size_field['options'], estimate_name=estimate_name)
+            self._sizes[estimate_name] = size
+
+        return self._sizes[estimate_name]
@@ -0,0 +1,70 @@
+import glob
+import hashlib
+import json
+import os
+import config
+from logger import logger
+
+
+def shard_of(item_id, shard_count):
+    """
+    Return the shard of an item. The partition only depends on the item ID,
+    so that every worker of a matrix agrees on it without coordination.
+    """
+    return int(hashlib.sha1(item_id.encode()).hexdigest()[:8], 16) % shard_count
+
+
+def filter_shard(items, shard_index, shard_count):
+    """
+    Return the items of the given shard
+    """
+    return [item for item in items if shard_of(item.id, shard_count) == shard_index]
+
+
+def is_sharded():
+    return config.shard_count > 1
+
+
+def results_path(shard_index, shard_count):
+    return os.path.join(config.shard_results_dir, f'shard-{shard_index}-of-{shard_count}.json')
+
+
+def write_results(summary, digest=None):
+    """
+    Write the results of this shard for the merge step: the run metrics and the
+    summaries that the digest of the comments issue will be made of
+    """
+    path = results_path(config.shard_index, config.shard_count)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({
+            'shard_index': config.shard_index,
+            'shard_count': config.shard_count,
+            'summary': summary,
+            'digest': digest.items if digest else []
+        }, f)
+
+    logger.info(f'Shard {config.shard_index + 1}/{config.shard_count}: results written to {path}')
+
+
+def read_results(directory=None):
+    """
+    Read the results files of the shards, which may be nested in one directory per artifact
+    """
+    directory = directory or config.shard_results_dir
+    results = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', 'shard-*-of-*.json'), recursive=True)):
+        with open(path) as f:
+            results.append(json.load(f))
+
+    if not results:
+        logger.error(f'No shard results found in {directory}')
+        return results
+
+    shard_count = results[0]['shard_count']
+    found = {result['shard_index'] for result in results}
+    missing = sorted(set(range(shard_count)) - found)
+    if missing:
+        logger.error(f'Missing the results of shards {missing} of {shard_count}')
+
+    return sorted(results, key=lambda result: result['shard_index'])
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+import time
+
+
+def affinity_rank(affinity, index):
+    return hashlib.sha1(f'{affinity}:{index}'.encode()).digest()
+
+
+class PooledToken:
+    """
+    A token of the pool, with the scheduler that paces its own rate limit budget
+    """
+
+    def __init__(self, index, token, scheduler):
+        self.index = index
+        self.token = token
+        self.scheduler = scheduler
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.requests = 0
+        # The account of the token, once resolved by graphql.get_viewer_logins
+        self.login = None
+
+    @property
+    def name(self):
+        return f'token {self.index + 1} ({self.login})' if self.login else f'token {self.index + 1}'
+
+
+class TokenPool:
+    """
+    Spreads the requests of a client over several tokens, such as the installation
+    tokens of several GitHub Apps, to add up their rate limit budgets.
+
+    A request goes to the token with the most points left. A request with an affinity,
+    such as the ID of the issue a comment goes to, always goes to the same token while
+    it has points left, so that the comments of an issue keep the same author. The
+    tokens down to their reserve, or told to back off, are skipped until they reset.
+    """
+
+    def __init__(self, tokens, scheduler_factory):
+        # The same token given twice would only share its budget
+        tokens = list(dict.fromkeys(token for token in tokens if token))
+        self.tokens = [PooledToken(index, token, scheduler_factory()) for index, token in enumerate(tokens)]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def acquire(self, affinity=None):
+        """
+        Return the token to send the next request with
+        """
+        if len(self.tokens) == 1:
+            token = self.tokens[0]
+        else:
+            now = time.time()
+            available = [token for token in self.tokens if not token.scheduler.exhausted(now)]
+            if not available:
+                # Every token has to wait, the one that can send first is used
+                token = min(self.tokens, key=lambda token: token.scheduler.available_at())
+            elif affinity is not None:
+                token = max(available, key=lambda token: affinity_rank(affinity, token.index))
+            else:
+                token = max(available, key=lambda token: token.scheduler.budget())
+
+        with self.lock:
+            token.requests += 1
+
+        return token
+
+    def for_login(self, login):
+        """
+        Return the token of the given account, None when no token of the pool resolved to it
+        """
+        return next((token for token in self.tokens if login and token.login == login), None)
+
+    def projected_cost(self, reads=0, writes=0):
+        """
+        Project the cost of the given requests spread over the tokens of the pool
+        """
+        costs = [token.scheduler.projected_cost(reads=reads, writes=writes) for token in self.tokens]
+        remaining = [cost['remaining'] for cost in costs if cost['remaining'] is not None]
+
+        return dict(
+            costs[0],
+            seconds=costs[0]['seconds'] / len(costs),
+            remaining=sum(remaining) if remaining else None,
+            reset_at=min((cost['reset_at'] for cost in costs if cost['reset_at']), default=None)
+        )
+
+    def stats(self):
+        return [
+            {'token': token.name, 'requests': token.requests, 'remaining': token.scheduler.remaining}
+            for token in self.tokens
+        ]
@@ -1,34 +1,208 @@
+import bisect
+import contextvars
+import hashlib
+import itertools
+import queue
+import re
+import threading
+import time
+import requests
 import graphql
 import config
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from logger import logger
+from metrics import run_metrics
+from retry import CircuitOpenError, TransientError
 
+DUEDATE_COMMENT_PREFIX = 'The Due Date is updated to:'
 
-def prepare_duedate_comment(issue: dict, assignees: dict, due_date):
+# Hidden markers of the comments written by the action, one per item field the comment announces:
+# <!-- project-automations:<field> item=<issue id> hash=<hash of the value> -->
+COMMENT_MARKER = '<!-- project-automations:'
+COMMENT_MARKER_PATTERN = re.compile(r'<!-- project-automations:(\S+) item=(\S+) hash=(\w+) -->')
+DUEDATE_MARKER_FIELD = 'duedate'
+
+# Size thresholds in hours of the Size options
+SIZE_THRESHOLDS = {
+    'X-Large (1-4 weeks)': (168, float('inf')),  # >168 hours (1-4 weeks)
+    'Large (4+ -7 days)': (96, 168),  # 96-168 hours (4-7 days)
+    'Medium (2+ -4 days)': (48, 96),  # 48-96 hours (2-4 days)
+    'Small (1-2 days)': (24, 48),  # 24-48 hours (1-2 days)
+    'Tiny (< 1 day, 1-6 hours)': (0, 24)  # <24 hours (Tiny)
+}
+
+
+def prepare_duedate_comment(issue, assignees, due_date):
     """
-    Prepare the comment from the given arguments and return it
+    Prepare the comment from the given arguments and return it, with the marker of the due date
+
+    :param issue: The Issue of the item
+    :param assignees: The logins of the assignees
     """
 
     comment = ''
     if assignees:
-        for assignee in assignees:
-            comment += f'@{assignee["login"]} '
+        for login in assignees:
+            comment += f'@{login} '
     else:
-        logger.info(f'No assignees found for issue #{issue["number"]}')
+        logger.info(f'No assignees found for issue #{issue.number}')
+
+    comment += f'{DUEDATE_COMMENT_PREFIX} {due_date.strftime("%b %d, %Y")}.'
+    logger.info(f'Issue {issue.title} | {comment}')
+
+    return f'{comment}\n{comment_marker(DUEDATE_MARKER_FIELD, issue.id, due_date.isoformat())}'
 
-    comment += f'The Due Date is updated to: {due_date.strftime("%b %d, %Y")}.'
-    logger.info(f'Issue {issue["title"]} | {comment}')
+
+def prepare_fields_comment(issue, fields):
+    """
+    Return the summary of the updated fields of an issue, with the markers of the fields
+    """
+    comment = "The following fields have been updated:\n" + "\n".join(
+        [f"- {item['field']}: **{item['value']}**" for item in fields]
+    )
+    comment += "\n" + "\n".join(
+        comment_marker(item['field'], issue.id, item['value']) for item in fields
+    )
 
     return comment
 
 
+def marker_field(field):
+    return re.sub(r'\s+', '_', field.strip().lower())
+
+
+def comment_marker(field, item_id, value):
+    """
+    Return the hidden marker announcing the value of a field of an item
+    """
+    value_hash = hashlib.sha1(str(value).encode()).hexdigest()[:12]
+    return f'{COMMENT_MARKER}{marker_field(field)} item={item_id} hash={value_hash} -->'
+
+
+def comment_markers(body):
+    """
+    Return the set of (field, item ID, value hash) markers of a comment body
+    """
+    if not body or COMMENT_MARKER not in body:
+        return set()
+
+    return set(COMMENT_MARKER_PATTERN.findall(body))
+
+
+def comment_announces(comment, marker, legacy_text):
+    """
+    Whether a comment of the action already announces the given marker. Comments written
+    before the markers were introduced are matched on their text instead.
+    """
+    if comment is None:
+        return False
+
+    markers = comment_markers(comment)
+    if markers:
+        return bool(comment_markers(marker) & markers)
+
+    return legacy_text in comment
+
+
+def prefetch(iterable, size=1):
+    """
+    Consume the iterable in a background thread, keeping up to `size` elements
+    ready ahead of the caller
+    """
+    if size <= 0:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=size)
+    done = object()
+
+    def produce():
+        try:
+            for element in iterable:
+                buffer.put((element, None))
+        except Exception as e:
+            buffer.put((None, e))
+            return
+        buffer.put((done, None))
+
+    # The producer runs in the context of the caller, so that its requests count for the same project
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+
+    while True:
+        element, error = buffer.get()
+        if error is not None:
+            raise error
+        if element is done:
+            return
+        yield element
+
+
 def check_comment_exists(issueId, expected_comment):
-    """Check if the comment already exists on the issue."""
-    comments = graphql.get_issue_comments(issueId)
-    for comment in comments:
-        if expected_comment in comment.get('body', ''):
+    """
+    Check if the comment already exists on the issue. Comments with markers are found by
+    their markers in the latest comments of the action instead of scanning the whole thread.
+
+    :raise requests.RequestException: When the comments of the issue could not be read
+    """
+    markers = comment_markers(expected_comment)
+    if not markers:
+        comments = graphql.get_issue_comments(issueId)
+        for comment in comments:
+            if expected_comment in comment.get('body', ''):
+                return True
+        return False
+
+    # Once added, the comment is the latest comment of the action announcing any of its markers
+    found = graphql.get_latest_matching_comments(
+        issue_ids=[issueId],
+        contains=[f'{COMMENT_MARKER}{field} item={item_id} ' for field, item_id, _ in markers],
+        author_login=graphql.get_viewer_logins()
+    )
+    # The issue is left out when its comments could not be read
+    if issueId not in found:
+        raise TransientError(f'Could not read the comments of {issueId}')
+    return markers <= comment_markers(found[issueId])
+
+
+def post_comment(issueId, comment):
+    """
+    Add a comment to an issue, retrying when the request failed in a way that may pass.
+    A failed request may still have added the comment, so it is only sent again once the
+    lookup of its markers, or of its text, shows that it was not added.
+
+    :return: True if the comment is on the issue, False otherwise
+    """
+    policy = graphql.client.retry_policy
+    deadline = time.monotonic() + policy.deadline
+
+    for attempt in itertools.count():
+        try:
+            return bool(graphql.add_issue_comment(issueId, comment))
+        except CircuitOpenError as e:
+            # The request was not sent, and the API is down for longer than the retries would wait
+            logger.error(f"Failed to add comment to {issueId}: {e}")
+            return False
+        except requests.RequestException as e:
+            error = e
+
+        if not policy.backoff(attempt, deadline):
+            logger.error(f"Failed to add comment to {issueId}: {error}")
+            return False
+
+        try:
+            exists = check_comment_exists(issueId, comment)
+        except requests.RequestException as e:
+            # Sending the comment again could post it twice
+            logger.error(f"Failed to add comment to {issueId}, and could not check whether it was added: {e}")
+            return False
+
+        if exists:
+            logger.info(f"Comment request to {issueId} failed ({error}), but the comment was added")
+            run_metrics.count('confirmed_comments')
             return True
-    return False
+
+        logger.info(f"Comment request to {issueId} failed ({error}), the comment was not added, retrying")
+        run_metrics.count('replayed_comments')
 
 
 def find_week(weeks, date_str):
@@ -83,6 +257,75 @@ def find_previous_week(weeks, date_str):
     return previous_week
 
 
+class IterationIndex:
+    """
+    Index of the iterations of a Week field, sorted by start date, answering the
+    same lookups as find_week and find_previous_week with a binary search.
+    """
+
+    def __init__(self, weeks):
+        # Keep the original position, as find_week returns the first matching week of the list
+        entries = []
+        for position, week in enumerate(weeks):
+            start_date = date.fromisoformat(week['startDate'])
+            end_date = start_date + timedelta(days=week['duration'] - 1)
+            entries.append((start_date, end_date, position, week))
+
+        # A stable sort, like the one of find_previous_week
+        entries.sort(key=lambda entry: entry[0])
+
+        self.entries = entries
+        self.starts = [entry[0] for entry in entries]
+        self.max_duration = max((week['duration'] for week in weeks), default=1)
+
+    def find_week(self, date_str, today=None):
+        target_date = date.fromisoformat(date_str)
+
+        # Calculate the current week (Monday to Sunday)
+        today = today or datetime.today().date()
+        start_of_week = today - timedelta(days=today.weekday())
+        end_of_week = start_of_week + timedelta(days=6)
+
+        if not start_of_week <= target_date <= end_of_week:
+            return self.find_previous_week(date_str)
+
+        # The first week of the original list that includes the target date
+        containing = [entry for entry in self._candidates(target_date) if entry[1] >= target_date]
+        if not containing:
+            return None
+
+        return min(containing, key=lambda entry: entry[2])[3]
+
+    def find_previous_week(self, date_str):
+        target_date = date.fromisoformat(date_str)
+
+        # The first sorted week that includes the target date or starts after it
+        after = bisect.bisect_right(self.starts, target_date)
+        index = next(
+            (index for index, entry in self._indexed_candidates(target_date) if entry[1] >= target_date),
+            after if after < len(self.entries) else None
+        )
+
+        if not index:
+            return None
+
+        return self.entries[index - 1][3]
+
+    def _indexed_candidates(self, target_date):
+        """
+        The sorted weeks that start on the target date or before it and may still include it
+        """
+        lowest_start = target_date - timedelta(days=self.max_duration - 1)
+        low = bisect.bisect_left(self.starts, lowest_start)
+        high = bisect.bisect_right(self.starts, target_date)
+
+        for index in range(low, high):
+            yield index, self.entries[index]
+
+    def _candidates(self, target_date):
+        return [entry for _, entry in self._indexed_candidates(target_date)]
+
+
 def find_release(releases, date_str):
     from datetime import datetime
 
@@ -125,16 +368,88 @@ def find_release(releases, date_str):
     return None  # Return None if no matching release is found
 
 
-def find_size(sizes, estimate_name):
-    # Define size thresholds dynamically from the size definitions
-    size_thresholds = {
-        'X-Large (1-4 weeks)': (168, float('inf')),  # >168 hours (1-4 weeks)
-        'Large (4+ -7 days)': (96, 168),  # 96-168 hours (4-7 days)
-        'Medium (2+ -4 days)': (48, 96),  # 48-96 hours (2-4 days)
-        'Small (1-2 days)': (24, 48),  # 24-48 hours (1-2 days)
-        'Tiny (< 1 day, 1-6 hours)': (0, 24)  # <24 hours (Tiny)
-    }
+def parse_release_range(name, year):
+    """
+    Parse the date range of a release name for a target date of the given year,
+    with the same year rules as find_release.
+
+    :return: The (start, end) dates, or None if the name has no date range
+    """
+    date_range = name.split('(')[0].strip()  # Get the part before the version
+    if ' - ' not in date_range:
+        return None
+
+    start_date_str, end_date_str = date_range.split(' - ')
+    # Append the year of the target date to the end date
+    if ',' not in end_date_str:
+        end_date_str += f", {year}"
+    end_date = datetime.strptime(end_date_str.strip(), '%b %d, %Y').date()
+
+    if ',' not in start_date_str:
+        # Use the year of the end date, or the previous one if the range spans the new year
+        start_date = datetime.strptime(start_date_str.strip() + f", {end_date.year}", '%b %d, %Y').date()
+        if start_date.month > end_date.month:
+            start_date = start_date.replace(year=end_date.year - 1)
+    else:
+        start_date = datetime.strptime(start_date_str.strip(), '%b %d, %Y').date()
+
+    return start_date, end_date
+
+
+class ReleaseCalendar:
+    """
+    The date ranges of the Release options, compiled once and sorted by start date.
+
+    As release names may omit the year, the ranges depend on the year of the target
+    date. They are compiled once per target year, and every name that cannot be
+    parsed is reported once instead of once per item.
+    """
 
+    def __init__(self, releases, year=None):
+        self.releases = releases
+        self.years = {}
+        # Compile the current year up front, so that the parsing errors show at the start of the run
+        self._ranges(year or datetime.today().year)
+
+    def _ranges(self, year):
+        if year in self.years:
+            return self.years[year]
+
+        entries = []
+        for position, release in enumerate(self.releases):
+            try:
+                date_range = parse_release_range(release['name'], year)
+            except Exception as e:
+                logger.error(f"Error parsing release: {release['name']}, Error: {e}")
+                continue
+
+            if date_range:
+                logger.debug(f"Release: {release['name']}, Start: {date_range[0]}, End: {date_range[1]}")
+                entries.append((date_range[0], date_range[1], position, release))
+
+        entries.sort(key=lambda entry: entry[0])
+        starts = [entry[0] for entry in entries]
+        max_span = max([entry[1] - entry[0] for entry in entries] + [timedelta(0)])
+
+        self.years[year] = (entries, starts, max_span)
+        return self.years[year]
+
+    def find_release(self, date_str):
+        target_date = date.fromisoformat(date_str)
+        entries, starts, max_span = self._ranges(target_date.year)
+
+        # Only the releases starting within the longest span before the target date can include it
+        low = bisect.bisect_left(starts, target_date - max_span)
+        high = bisect.bisect_right(starts, target_date)
+        containing = [entry for entry in entries[low:high] if entry[1] >= target_date]
+        if not containing:
+            return None
+
+        # The first matching release of the original list
+        return min(containing, key=lambda entry: entry[2])[3]
+
+
+def find_size(sizes, estimate_name):
     # Convert the estimate to comparable hours
     if 'week' in estimate_name:
         value = float(estimate_name.split()[0]) * 7 * 24  # weeks to hours
@@ -150,7 +465,7 @@ def find_size(sizes, estimate_name):
     # Find the matching size based on thresholds
     for size in sizes:
         size_name = size['name']
-        lower, upper = size_thresholds.get(size_name, (None, None))
+        lower, upper = SIZE_THRESHOLDS.get(size_name, (None, None))
         if lower is not None and lower < value <= upper:
             return size  # Return the matching size definition
 